@@ -0,0 +1,371 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Replays a recording through the sampling state machine of Finger_Calibration without Pupil Capture
+# (UI, OpenGL, audio and Pupil's calibration are replaced by stubs) to tune the number of samples and the marker speed offline
+# Run from the repository root:
+#   python benchmarks/calibration_replay.py recording/world.mp4 --pupil-data recording/pupil_data --counter-max 10 20 30 --max-speed 0.2 0.3
+
+import argparse
+import importlib
+import itertools
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+import types
+import numpy as np
+
+REPOSITORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, REPOSITORY)
+
+# The plugin imports Pupil's calibration modules relative to its parent package, it is loaded as subpackage of this stand-in
+PACKAGE = 'replayed_calibration_routines'
+
+'''
+Accepts any call and attribute access (stand-in for UI elements)
+'''
+class Stub():
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return Stub()
+
+    def __getattr__(self, name):
+        return Stub()
+
+def stub_module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    module.__getattr__ = lambda attribute: Stub
+    sys.modules[name] = module
+    return module
+
+def normalize(pos, size, flip_y=False):
+    # Same as Pupil's methods.normalize
+    x = pos[0] / float(size[0])
+    y = pos[1] / float(size[1])
+    return (x, 1 - y) if flip_y else (x, y)
+
+class Replay_Session():
+
+    '''
+    Collects what the plugin hands to Pupil: notifications (delivered back to the plugin on the next frame, as in Pupil's event loop)
+    and the pupil and reference lists passed to the calibration
+    '''
+    def __init__(self):
+        self.timestamp = 0.
+        self.notifications = []
+        self.pending = []
+        self.pupil_list = []
+        self.ref_list = []
+
+    def notify(self, notification):
+        self.notifications.append(notification)
+        self.pending.append(notification)
+
+    def finish(self, pupil_list, ref_list):
+        self.pupil_list = pupil_list
+        self.ref_list = ref_list
+
+class Calibration_Plugin():
+
+    '''
+    Minimal stand-in for Pupil's calibration plugin base
+    '''
+    def __init__(self, g_pool):
+        self.g_pool = g_pool
+        self.active = False
+        self.mode = 'calibration'
+        self.mode_pretty = 'Calibration'
+        self.pupil_confidence_threshold = 0.6
+        self.button = types.SimpleNamespace(status_text='')
+
+    def init_ui(self):
+        pass
+
+    def deinit_ui(self):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def on_notify(self, notification):
+        pass
+
+    def notify_all(self, notification):
+        self.g_pool.session.notify(notification)
+
+    def finish_accuracy_test(self, pupil_list, ref_list):
+        self.g_pool.session.finish(pupil_list, ref_list)
+
+def finish_calibration(g_pool, pupil_list, ref_list):
+    g_pool.session.finish(pupil_list, ref_list)
+
+'''
+Imports the plugin with stubs for everything it needs from Pupil Capture (Pupil's methods module is used if it can be imported)
+'''
+def load_plugin():
+    if PACKAGE + '.finger_detection.finger_calibration' in sys.modules:
+        return sys.modules[PACKAGE + '.finger_detection.finger_calibration']
+
+    stub_module('audio', say=lambda *args: None, beep=lambda: None, tink=lambda: None)
+    stub_module('glfw', GLFW_PRESS=1)
+    stub_module('OpenGL')
+    stub_module('OpenGL.GL', GL_POLYGON=9)
+    stub_module('pyglui')
+    stub_module('pyglui.ui')
+    stub_module('pyglui.cygl')
+    stub_module('pyglui.cygl.utils')
+    try:
+        importlib.import_module('methods')
+    except ImportError:
+        stub_module('methods', normalize=normalize)
+
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [REPOSITORY]
+    sys.modules[PACKAGE] = package
+    stub_module(PACKAGE + '.finish_calibration', finish_calibration=finish_calibration)
+    stub_module(PACKAGE + '.calibration_plugin_base', Calibration_Plugin=Calibration_Plugin)
+    return importlib.import_module(PACKAGE + '.finger_detection.finger_calibration')
+
+'''
+Loads pupil positions and fixations from Pupil's pupil_data file (msgpack or, for older recordings, pickle)
+Returns both lists sorted by timestamp
+'''
+def load_pupil_data(path):
+    with open(path, 'rb') as file:
+        try:
+            import msgpack
+            data = msgpack.unpack(file, raw=False)
+        except Exception:
+            file.seek(0)
+            data = pickle.load(file, encoding='bytes')
+    pupil = sorted(data.get('pupil_positions', []), key=lambda datum: datum['timestamp'])
+    fixations = sorted(data.get('fixations', []), key=lambda datum: datum['timestamp'])
+    return pupil, fixations
+
+'''
+Stand-in for Finger_Tracker which returns the detections (timestamp, (fingers, contour)) of an earlier run
+Frames which weren't detected in that run (skipped static fingers) get the detection of the frame before
+'''
+class Recorded_Tracker():
+    def __init__(self, detections):
+        self.timestamps = np.array([timestamp for timestamp, _ in detections])
+        self.results = [result for _, result in detections]
+        self.pyramid = False
+        self.segmentation = None
+        self.elapsed = 0.
+        self.calls = 0
+
+    def reset(self):
+        pass
+
+    def findFingers(self, frame, threshold, segmentation_color, finger_correction_scale, motion=None, timestamp=None):
+        self.calls += 1
+        index = int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1
+        return self.results[index] if index >= 0 else ([], [])
+
+'''
+Wraps Finger_Tracker.findFingers to keep the detections (timestamp, result) and the time spent in them
+'''
+class Timed_Tracker():
+    def __init__(self, tracker):
+        self.tracker = tracker
+        self.detections = []
+        self.elapsed = 0.
+        self.calls = 0
+
+    def __getattr__(self, name):
+        return getattr(self.tracker, name)
+
+    def __setattr__(self, name, value):
+        if name in ('tracker', 'detections', 'elapsed', 'calls'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self.tracker, name, value)
+
+    def findFingers(self, frame, threshold, segmentation_color, finger_correction_scale, motion=None, timestamp=None):
+        start = time.perf_counter()
+        result = self.tracker.findFingers(frame, threshold, segmentation_color, finger_correction_scale, motion, timestamp)
+        self.elapsed += time.perf_counter() - start
+        self.calls += 1
+        self.detections.append((timestamp, result))
+        return result
+
+def load_detections(path):
+    data = np.load(path)
+    offsets = data['tip_offsets']
+    return [(timestamp, (data['tips'][offsets[i]:offsets[i + 1]].tolist(), [])) for i, timestamp in enumerate(data['timestamp'].tolist())]
+
+'''
+Returns the data which is newer than the previous frame, up to the frame's timestamp, and the index of the next datum
+data is sorted by timestamp (data_timestamps), start is the index of the first datum which hasn't been handed out yet
+'''
+def frame_data(data, data_timestamps, timestamp, start):
+    end = int(np.searchsorted(data_timestamps, timestamp, side='right'))
+    return data[start:end], end
+
+'''
+Runs one calibration over all frames and returns the detections, the frame size, the frame timestamps and the replay statistics
+frames yields (timestamp, image), images are only used if there are no detections (frame_size is needed without images)
+Without detections, the fingertips are detected by the plugin's Finger_Tracker (with the given Detection_Cache, if any)
+'''
+def replay(plugin_module, frames, pupil, fixations, settings, detections=None, frame_size=None, cache=None):
+    session = Replay_Session()
+    user_dir = tempfile.mkdtemp(prefix='finger_replay_')
+    g_pool = types.SimpleNamespace(user_dir=user_dir, session=session, get_timestamp=lambda: session.timestamp)
+
+    plugin_module.MAX_MARKER_SPEED = settings['max_speed']
+    plugin = plugin_module.Finger_Calibration(g_pool)
+    plugin.mode = settings['mode']
+    plugin.counter_max = settings['counter_max']
+    plugin.static_finger = settings['static_finger']
+    plugin.incremental = settings['incremental']
+    plugin.pyramid_detection = settings['pyramid']
+    plugin.correct_finger_scale = settings['correction_scale']
+    (plugin.color_h, plugin.color_s, plugin.color_v, plugin.color_tolerance_h, plugin.color_tolerance_s, plugin.color_tolerance_v) = settings['color']
+    plugin.pupil_confidence_threshold = settings['confidence']
+    plugin.set_adaptive_color(settings['adaptive_color'])
+    plugin.skip_static_frames = settings['skip_static_frames']
+    if detections is not None:
+        plugin.finger_tracker = Recorded_Tracker(detections)
+        # The motion check of skipped frames needs the images
+        plugin.skip_static_frames = False
+    else:
+        plugin.finger_tracker = Timed_Tracker(plugin.finger_tracker)
+        plugin.finger_tracker.cache = cache
+
+    pupil_timestamps = np.array([datum['timestamp'] for datum in pupil])
+    fixation_timestamps = np.array([datum['timestamp'] for datum in fixations])
+    pupil_start = fixation_start = 0
+    timestamps = []
+    durations = []
+    detection_durations = []
+
+    plugin.start()
+    for timestamp, image in frames:
+        if image is not None:
+            frame_size = (image.shape[1], image.shape[0])
+        timestamps.append(timestamp)
+
+        # Notifications reach the plugins in the next iteration of Pupil's event loop
+        session.timestamp = timestamp
+        for notification in session.pending:
+            plugin.on_notify(notification)
+        session.pending = []
+
+        frame_pupil, pupil_start = frame_data(pupil, pupil_timestamps, timestamp, pupil_start)
+        frame_fixations, fixation_start = frame_data(fixations, fixation_timestamps, timestamp, fixation_start)
+        frame = types.SimpleNamespace(img=image, timestamp=timestamp, width=frame_size[0], height=frame_size[1])
+        events = {'frame': frame, 'pupil_positions': frame_pupil, 'fixations': frame_fixations}
+
+        detection_start = plugin.finger_tracker.elapsed
+        start = time.perf_counter()
+        plugin.recent_events(events)
+        durations.append(time.perf_counter() - start)
+        detection_durations.append(plugin.finger_tracker.elapsed - detection_start)
+
+    start = time.perf_counter()
+    plugin.stop()
+    stop_duration = time.perf_counter() - start
+    if cache is not None:
+        cache.save()
+    shutil.rmtree(user_dir, ignore_errors=True)
+
+    # The per frame overhead is the time spent in the plugin besides the detection
+    durations = np.array(durations)
+    detection_durations = np.array(detection_durations)
+    overhead = (durations - detection_durations) * 1000
+    if isinstance(plugin.finger_tracker, Timed_Tracker):
+        detections = plugin.finger_tracker.detections
+
+    subjects = [notification['subject'] for notification in session.notifications]
+    completed = [notification['timestamp'] for notification in session.notifications if notification['subject'] == 'calibration.marker_sample_completed']
+    sites = settings['sites']
+    stats = {
+        'sites': len(completed),
+        'aborted': subjects.count('calibration.marker_moved_too_quickly'),
+        'ref_samples': len(session.ref_list),
+        'pupil_samples': len(session.pupil_list),
+        'time_to_calibration': completed[sites - 1] - timestamps[0] if len(completed) >= sites else None,
+        'detected_frames': plugin.finger_tracker.calls,
+        'detection_ms': detection_durations.sum() / len(durations) * 1000 if detection_durations.any() else None,
+        'overhead_ms': (np.median(overhead), np.percentile(overhead, 95)) if len(overhead) > 0 else (0., 0.),
+        'stop_ms': stop_duration * 1000,
+    }
+    return detections, frame_size, timestamps, stats
+
+def main(argv=None):
+    plugin_module = load_plugin()
+    detection_cache = importlib.import_module(PACKAGE + '.finger_detection.detection_cache')
+    read_frames = importlib.import_module(PACKAGE + '.finger_detection.batch_detection').read_frames
+
+    parser = argparse.ArgumentParser(description='Replay a recording through the finger calibration without Pupil Capture.')
+    parser.add_argument('input', help='world video (with Pupil\'s <name>_timestamps.npy) or directory of images')
+    parser.add_argument('--pupil-data', help='Pupil\'s pupil_data file of the recording (pupil positions and fixations)')
+    parser.add_argument('--fingertips', help='fingertips of the recording from finger_detection.batch_detection, skips the detection')
+    parser.add_argument('--counter-max', type=int, nargs='+', default=[30], help='number of samples per site (several values are compared)')
+    parser.add_argument('--max-speed', type=float, nargs='+', default=[0.3], help='marker speed (normalized units per second) up to which a fingertip counts as steady (several values are compared)')
+    parser.add_argument('--sites', type=int, default=9, help='number of sample sites of a full calibration (for the time to calibration)')
+    parser.add_argument('--mode', choices=['calibration', 'accuracy_test'], default='calibration')
+    parser.add_argument('--moving-finger', action='store_true', help='keep updating the marker while sampling (static fingers off)')
+    parser.add_argument('--no-skip-frames', action='store_true', help='detect every frame, also while an unmoved static finger is sampled')
+    parser.add_argument('--no-incremental', action='store_true', help='don\'t match samples while sampling')
+    parser.add_argument('--pyramid', action='store_true', help='search the hand at lower resolution')
+    parser.add_argument('--adaptive-color', action='store_true', help='adapt the color model to the detected hands')
+    parser.add_argument('--color', type=float, nargs=6, default=[20, 36, 62, 20, 24, 38], metavar=('H', 'S', 'V', 'RANGE_H', 'RANGE_S', 'RANGE_V'),
+        help='hand color and tolerances as in the plugin menu (hue in degrees, saturation and value in percent)')
+    parser.add_argument('--correction-scale', type=float, default=25, help='finger correction scale in pixels')
+    parser.add_argument('--cache', help='directory of the detection cache, frames detected before with the same parameters are read from it')
+    parser.add_argument('--cache-budget', type=float, default=detection_cache.DEFAULT_BUDGET / 1024 ** 2, help='disk space (MB) of the cache directory')
+    parser.add_argument('--confidence', type=float, default=0.6, help='minimal confidence of the pupil positions which are sampled')
+    args = parser.parse_args(argv)
+
+    pupil, fixations = load_pupil_data(args.pupil_data) if args.pupil_data else ([], [])
+
+    cache = None
+    if args.cache and not args.fingertips:
+        # Same threshold and color normalization as Finger_Calibration.recent_events
+        color_threshold = plugin_module.Color_Segmentation.normalizeThreshold(*args.color)
+        key = detection_cache.cache_key(detection_cache.recording_id(args.input), 'tracker', 30, color_threshold, args.correction_scale, args.pyramid, args.adaptive_color)
+        cache = detection_cache.Detection_Cache(args.cache, key, int(args.cache_budget * 1024 ** 2))
+
+    # The fingertips are only detected in the first run, later runs replay them (frames are decoded once)
+    detections = load_detections(args.fingertips) if args.fingertips else None
+    frames = read_frames(args.input)
+    frame_size = None
+    if detections is not None:
+        timestamp, image = next(frames)
+        frame_size = (image.shape[1], image.shape[0])
+        frames = itertools.chain([(timestamp, None)], ((timestamp, None) for timestamp, _ in frames))
+
+    print('{:>11} {:>9} {:>6} {:>8} {:>12} {:>13} {:>15} {:>9} {:>14} {:>20} {:>9}'.format(
+        'counter_max', 'max_speed', 'sites', 'aborted', 'ref samples', 'pupil samples', 'calibration [s]', 'detected', 'detection [ms]', 'overhead [ms] 50/95', 'stop [ms]'))
+    for counter_max, max_speed in itertools.product(args.counter_max, args.max_speed):
+        settings = {'counter_max': counter_max, 'max_speed': max_speed, 'sites': args.sites, 'mode': args.mode,
+                    'static_finger': not args.moving_finger, 'skip_static_frames': not args.no_skip_frames, 'incremental': not args.no_incremental, 'pyramid': args.pyramid,
+                    'adaptive_color': args.adaptive_color, 'color': args.color, 'correction_scale': args.correction_scale, 'confidence': args.confidence}
+        detections, frame_size, timestamps, stats = replay(plugin_module, frames, pupil, fixations, settings, detections, frame_size, cache)
+        if len(timestamps) == 0:
+            print('No frames in {}'.format(args.input))
+            return 1
+        frames = [(timestamp, None) for timestamp in timestamps]
+
+        time_to_calibration = '-' if stats['time_to_calibration'] is None else '{:.2f}'.format(stats['time_to_calibration'])
+        detection = '-' if stats['detection_ms'] is None else '{:.2f}'.format(stats['detection_ms'])
+        print('{:>11} {:>9.2f} {:>6} {:>8} {:>12} {:>13} {:>15} {:>9} {:>14} {:>20} {:>9.1f}'.format(
+            counter_max, max_speed, stats['sites'], stats['aborted'], stats['ref_samples'], stats['pupil_samples'], time_to_calibration, stats['detected_frames'], detection,
+            '{:.3f}/{:.3f}'.format(*stats['overhead_ms']), stats['stop_ms']))
+
+if __name__ == '__main__':
+    sys.exit(main())
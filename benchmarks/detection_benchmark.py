@@ -0,0 +1,165 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Times the detection stages on synthetic hand frames and checks the fingertip accuracy against the known tips
+# Run from the repository root:
+#   python benchmarks/detection_benchmark.py --save baseline.json
+#   python benchmarks/detection_benchmark.py --compare baseline.json
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from finger_detection.finger_detection import Finger_Detection, NEIGHBORHOOD_SIZE
+from finger_detection.color_segmentation import Color_Segmentation
+from finger_detection.parameter_sweep import match_tips
+from synthetic_hands import RESOLUTIONS, render_hand
+
+THRESHOLD = 30
+CORRECTION_SCALE = 25
+COLOR_THRESHOLD = Color_Segmentation.normalizeThreshold(20, 36, 62, 20, 24, 38)
+FRAMES_PER_SCENARIO = 10
+MAX_TIP_ERROR = 0.08 # Detections further away from every true tip (relative to frame height) count as false tips
+
+BASE_SCENARIO = {'resolution': '720p', 'fingers': 1, 'scale': 1.0, 'rotation': 0, 'noise': 0, 'clutter': 0}
+
+'''
+Scenarios vary one parameter of the base scenario at a time
+'''
+def scenarios():
+    variations = [('resolution', list(RESOLUTIONS)), ('fingers', [0, 1, 2, 3, 5]), ('scale', [0.6, 1.4]),
+                  ('rotation', [-30, 30]), ('noise', [8, 20]), ('clutter', [5, 20])]
+    yield dict(BASE_SCENARIO)
+    for key, values in variations:
+        for value in values:
+            if value != BASE_SCENARIO[key]:
+                scenario = dict(BASE_SCENARIO)
+                scenario[key] = value
+                yield scenario
+
+def scenario_name(scenario):
+    return ' '.join('{}={}'.format(key, scenario[key]) for key in BASE_SCENARIO)
+
+'''
+Accumulates the fingertip accuracy of one detection method over the frames of a scenario
+'''
+class Accuracy():
+    def __init__(self):
+        self.errors = []
+        self.missed = 0
+        self.false_tips = 0
+        self.total_tips = 0
+        self.frames = 0
+
+    def add(self, fingers, tips, max_dist):
+        frame_errors, frame_missed, frame_false = match_tips(fingers, tips, max_dist)
+        self.errors.extend(frame_errors)
+        self.missed += frame_missed
+        self.false_tips += frame_false
+        self.total_tips += len(tips)
+        self.frames += 1
+
+    def results(self, prefix=''):
+        return {prefix + 'tip_error_px': float(np.mean(self.errors)) if self.errors else None,
+                prefix + 'recall': (self.total_tips - self.missed) / self.total_tips if self.total_tips > 0 else None,
+                prefix + 'false_tips_per_frame': self.false_tips / self.frames}
+
+'''
+Runs all stages on the frames of one scenario, and the pyramid mode for comparison
+Returns the median time (ms) of every stage, frames per second, peak memory of findFingers (MB) and the accuracy of both modes
+'''
+def run_scenario(scenario, frames):
+    rng = np.random.RandomState(0)
+    width, height = RESOLUTIONS[scenario['resolution']]
+    rendered = [render_hand(width, height, scenario['fingers'], scenario['scale'], scenario['rotation'], scenario['noise'], scenario['clutter'], rng) for _ in range(frames)]
+
+    timings = {'removeBG': [], 'getHullPoints': [], 'detectFingers': [], 'findFingers': [], 'findFingersPyramid': []}
+    accuracy = Accuracy()
+    pyramid_accuracy = Accuracy()
+    peak_memory = 0
+
+    for frame, tips in rendered:
+        start = time.perf_counter()
+        Finger_Detection.removeBG(frame, COLOR_THRESHOLD)
+        timings['removeBG'].append(time.perf_counter() - start)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        fingers, contour = Finger_Detection.findFingers(frame, THRESHOLD, COLOR_THRESHOLD, CORRECTION_SCALE)
+        timings['findFingers'].append(time.perf_counter() - start)
+        peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+        if len(contour) > 0:
+            start = time.perf_counter()
+            Finger_Detection.getHullPoints(contour, NEIGHBORHOOD_SIZE)
+            timings['getHullPoints'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            Finger_Detection.detectFingers(contour, CORRECTION_SCALE)
+            timings['detectFingers'].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pyramid_fingers, _ = Finger_Detection.findFingersPyramid(frame, THRESHOLD, COLOR_THRESHOLD, CORRECTION_SCALE)
+        timings['findFingersPyramid'].append(time.perf_counter() - start)
+
+        accuracy.add(fingers, tips, MAX_TIP_ERROR * height)
+        pyramid_accuracy.add(pyramid_fingers, tips, MAX_TIP_ERROR * height)
+
+    result = {stage + '_ms': float(np.median(values) * 1000) if values else None for stage, values in timings.items()}
+    result['fps'] = float(1 / np.median(timings['findFingers']))
+    result['peak_memory_mb'] = peak_memory / 2 ** 20
+    result.update(accuracy.results())
+    result.update(pyramid_accuracy.results('pyramid_'))
+    return result
+
+def format_value(value):
+    return '-' if value is None else '{:.2f}'.format(value)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the fingertip detection on synthetic hand frames.')
+    parser.add_argument('--frames', type=int, default=FRAMES_PER_SCENARIO, help='frames per scenario')
+    parser.add_argument('--save', help='store the results as JSON baseline')
+    parser.add_argument('--compare', help='JSON baseline to compare the results against')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+
+    columns = ['removeBG_ms', 'getHullPoints_ms', 'detectFingers_ms', 'findFingers_ms', 'fps', 'peak_memory_mb', 'tip_error_px', 'recall', 'false_tips_per_frame',
+               'findFingersPyramid_ms', 'pyramid_tip_error_px', 'pyramid_recall', 'pyramid_false_tips_per_frame']
+    print('{:<75} '.format('scenario') + ' '.join('{:>20}'.format(column) for column in columns))
+
+    results = {}
+    for scenario in scenarios():
+        name = scenario_name(scenario)
+        result = run_scenario(scenario, args.frames)
+        results[name] = result
+
+        values = []
+        for column in columns:
+            value = format_value(result[column])
+            if baseline is not None and name in baseline and baseline[name].get(column) is not None and result[column] is not None:
+                value += ' ({})'.format(format_value(baseline[name][column]))
+            values.append(value)
+        print('{:<75} '.format(name) + ' '.join('{:>20}'.format(value) for value in values))
+
+    if baseline is not None:
+        print('Values in brackets are the baseline values from {}'.format(args.compare))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
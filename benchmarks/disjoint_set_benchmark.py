@@ -0,0 +1,90 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Compares the array backed DisjointSet against the previous list based implementation
+# Run from the repository root: python benchmarks/disjoint_set_benchmark.py
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from finger_detection.disjoint_set import DisjointSet
+
+SIZES = [100, 1000, 10000]
+REPEATS = 3
+
+class ListDisjointSet:
+
+	'''
+	Previous implementation, merges sets by extending lists and rewriting the member lookup
+	'''
+	def __init__(self, init_arr):
+		self.disjoint_set = []
+		self.set_member_lookup = {}
+
+		for index, item in enumerate(set(init_arr)):
+			self.disjoint_set.append([item])
+			self.set_member_lookup[item] = index
+
+	def union(self, elem1, elem2):
+		index_elem1 = self.set_member_lookup[elem1]
+		index_elem2 = self.set_member_lookup[elem2]
+
+		if index_elem1 != index_elem2:
+			self.disjoint_set[index_elem2].extend(list(self.disjoint_set[index_elem1]))
+
+			for k in self.disjoint_set[index_elem1]:
+				self.set_member_lookup[k] = index_elem2
+
+			self.disjoint_set[index_elem1] = None
+
+	def get(self):
+		return [e for e in self.disjoint_set if e is not None]
+
+def chain_pairs(n):
+	return np.arange(n - 1), np.arange(1, n)
+
+def random_pairs(n):
+	rng = np.random.RandomState(0)
+	return rng.randint(0, n, n), rng.randint(0, n, n)
+
+def time_it(func):
+	best = float('inf')
+	for _ in range(REPEATS):
+		start = time.perf_counter()
+		func()
+		best = min(best, time.perf_counter() - start)
+	return best
+
+def run_list(n, u, v):
+	disj_set = ListDisjointSet(range(n))
+	for a, b in zip(u.tolist(), v.tolist()):
+		disj_set.union(a, b)
+	return disj_set.get()
+
+def run_union(n, u, v):
+	disj_set = DisjointSet(range(n))
+	for a, b in zip(u.tolist(), v.tolist()):
+		disj_set.union(a, b)
+	return disj_set.get()
+
+def run_union_pairs(n, u, v):
+	disj_set = DisjointSet(range(n))
+	disj_set.union_pairs(u, v)
+	return disj_set.get()
+
+def main():
+	print('{:>8} {:>8} {:>14} {:>14} {:>14}'.format('pairs', 'n', 'list [ms]', 'union [ms]', 'union_pairs [ms]'))
+	for name, make_pairs in [('chain', chain_pairs), ('random', random_pairs)]:
+		for n in SIZES:
+			u, v = make_pairs(n)
+			timings = [time_it(lambda: run(n, u, v)) * 1000 for run in (run_list, run_union, run_union_pairs)]
+			print('{:>8} {:>8} {:>14.2f} {:>14.2f} {:>14.2f}'.format(name, n, *timings))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,106 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Compares the per-frame HSV range thresholding against the cached Color_Segmentation and its lookup tables
+# (time per frame, time to build the table and agreement of the table's mask with the exact one)
+# Run from the repository root: python benchmarks/segmentation_benchmark.py
+
+import itertools
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from finger_detection.color_segmentation import Color_Segmentation
+from finger_detection.frame_buffers import Frame_Buffers
+from synthetic_hands import render_hand
+
+RESOLUTIONS = [(1280, 720), (1920, 1080)]
+REPEATS = 20
+LUT_BITS = [5, 6, 7] # Quantization of the lookup tables (bits per channel)
+
+# Same normalization as Finger_Calibration.recent_events
+THRESHOLDS = {
+    'handskin': [20/2, 36 * 2.55, 62 * 2.55, 20/2, 24 * 2.55, 38 * 2.55],
+    'red glove': [0/2, 60 * 2.55, 60 * 2.55, 20/2, 40 * 2.55, 40 * 2.55],
+}
+
+'''
+Previous removeBG thresholding, converts to HSV and builds the range bounds on every frame
+'''
+def reference_mask(frame, segmentation_color):
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    h, s, v, tolerance_h, tolerance_s, tolerance_v = segmentation_color
+
+    if h >= tolerance_h and (h+tolerance_h) <= 180:
+        return cv2.inRange(hsv, np.array([h - tolerance_h, s - tolerance_s, v - tolerance_v]), np.array([h + tolerance_h, s + tolerance_s, v + tolerance_v]))
+    elif h < tolerance_h:
+        mask_temp1 = cv2.inRange(hsv, np.array([0, s - tolerance_s, v - tolerance_v]), np.array([h + tolerance_h, s + tolerance_s, v + tolerance_v]))
+        mask_temp2 = cv2.inRange(hsv, np.array([180 - (tolerance_h - h), s - tolerance_s, v - tolerance_v]), np.array([180, s + tolerance_s, v + tolerance_v]))
+        return cv2.addWeighted(mask_temp1, 1.0, mask_temp2, 1.0, 0.0)
+    else:
+        mask_temp1 = cv2.inRange(hsv, np.array([h - tolerance_h, s - tolerance_s, v - tolerance_v]), np.array([180, s + tolerance_s, v + tolerance_v]))
+        mask_temp2 = cv2.inRange(hsv, np.array([0, s - tolerance_s, v - tolerance_v]), np.array([0 + (h+tolerance_h-180), s + tolerance_s, v + tolerance_v]))
+        return cv2.addWeighted(mask_temp1, 1.0, mask_temp2, 1.0, 0.0)
+
+'''
+Smooth random colors with sensor noise, roughly the color statistics of a camera frame
+'''
+def make_frame(width, height, rng):
+    frame = cv2.resize(rng.randint(0, 256, (height // 32, width // 32, 3)).astype(np.uint8), (width, height), interpolation=cv2.INTER_CUBIC)
+    return cv2.add(frame, rng.randint(0, 12, frame.shape).astype(np.uint8))
+
+def time_it(func):
+    func()
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1000
+
+'''
+Fraction of equal pixels and intersection over union of two binary masks
+'''
+def agreement(mask, reference):
+    mask = mask > 0
+    reference = reference > 0
+    union = np.count_nonzero(mask | reference)
+    iou = np.count_nonzero(mask & reference) / union if union > 0 else 1.0
+    return np.count_nonzero(mask == reference) / mask.size, iou
+
+def main():
+    rng = np.random.RandomState(0)
+    print('{:>10} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('threshold', 'frame', 'size', 'path', 'time [ms]', 'build [ms]', 'agreement', 'iou'))
+
+    for width, height in RESOLUTIONS:
+        # Random colors are the worst case for the quantization, the rendered hand has large areas of one color
+        frames = {'random': make_frame(width, height, rng), 'hand': render_hand(width, height, 5, noise=8, clutter=10, rng=rng)[0]}
+
+        for (frame_name, frame), (name, segmentation_color) in itertools.product(frames.items(), THRESHOLDS.items()):
+            size = '{}x{}'.format(width, height)
+            reference = reference_mask(frame, segmentation_color)
+            print('{:>10} {:>6} {:>10} {:>10} {:>10.2f} {:>10} {:>10} {:>10}'.format(name, frame_name, size, 'previous', time_it(lambda: reference_mask(frame, segmentation_color)), '', '', ''))
+
+            ranges = Color_Segmentation()
+            buffers = Frame_Buffers()
+            assert np.array_equal(ranges.getMask(frame, segmentation_color, buffers), reference)
+            print('{:>10} {:>6} {:>10} {:>10} {:>10.2f} {:>10} {:>10} {:>10}'.format(name, frame_name, size, 'range', time_it(lambda: ranges.getMask(frame, segmentation_color, buffers)), '', '', ''))
+
+            for bits in LUT_BITS:
+                lut = Color_Segmentation(lut_bits=bits)
+                start = time.perf_counter()
+                lut.setThreshold(segmentation_color)
+                build_time = (time.perf_counter() - start) * 1000
+
+                pixel_agreement, iou = agreement(lut.getMask(frame, segmentation_color, buffers), reference)
+                print('{:>10} {:>6} {:>10} {:>10} {:>10.2f} {:>10.1f} {:>10.4f} {:>10.4f}'.format(name, frame_name, size, 'lut {}^3'.format(1 << bits),
+                      time_it(lambda: lut.getMask(frame, segmentation_color, buffers)), build_time, pixel_agreement, iou))
+
+if __name__ == '__main__':
+    main()
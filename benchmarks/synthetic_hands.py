@@ -0,0 +1,68 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Procedurally rendered hand silhouettes with known fingertip positions
+
+import colorsys
+import cv2
+import numpy as np
+
+RESOLUTIONS = {'480p': (640, 480), '720p': (1280, 720), '1080p': (1920, 1080), '4k': (3840, 2160)}
+
+# Hand color of the plugin's default handskin threshold (h=20, s=36, v=62)
+HAND_COLOR = tuple(int(c * 255) for c in colorsys.hsv_to_rgb(20/360, 0.36, 0.62)[::-1])
+
+# Finger directions (degrees, 0 is pointing up) and lengths beyond the palm relative to the palm radius, from thumb to little finger
+FINGER_ANGLES = [-70, -25, 0, 22, 45]
+FINGER_LENGTHS = [1.3, 1.8, 2.0, 1.8, 1.4]
+FINGER_WIDTH = 0.21 # Relative to the palm diameter
+
+def rotate(pnt, center, angle):
+    angle = np.deg2rad(angle)
+    dx, dy = pnt[0] - center[0], pnt[1] - center[1]
+    return (center[0] + np.cos(angle) * dx - np.sin(angle) * dy, center[1] + np.sin(angle) * dx + np.cos(angle) * dy)
+
+'''
+Renders a hand with the given number of stretched fingers
+scale is relative to the frame height, rotation in degrees, noise is the standard deviation of the pixel noise
+and clutter the number of random blobs in the background (some of them in hand color)
+Returns the BGR frame and the fingertip positions (center of the finger end) in pixels
+'''
+def render_hand(width, height, fingers=1, scale=1.0, rotation=0, noise=0, clutter=0, rng=None):
+    rng = rng if rng is not None else np.random.RandomState(0)
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[:] = (rng.randint(20, 90), rng.randint(60, 140), rng.randint(20, 90))
+
+    # Background blobs, drawn first such that the hand covers them
+    for i in range(clutter):
+        center = (int(rng.randint(0, width)), int(rng.randint(0, height)))
+        axes = (int(rng.uniform(0.01, 0.06) * height), int(rng.uniform(0.01, 0.06) * height))
+        color = HAND_COLOR if i % 3 == 0 else tuple(int(c) for c in rng.randint(0, 256, 3))
+        cv2.ellipse(frame, center, axes, float(rng.uniform(0, 180)), 0, 360, color, -1)
+
+    palm_radius = 0.09 * height * scale
+    center = (width * rng.uniform(0.35, 0.65), height * rng.uniform(0.55, 0.7))
+    finger_width = max(int(FINGER_WIDTH * palm_radius * 2), 2)
+
+    # Palm and wrist (the wrist leaves the frame at the bottom)
+    wrist_end = rotate((center[0], center[1] + 4 * palm_radius), center, rotation)
+    cv2.circle(frame, (int(center[0]), int(center[1])), int(palm_radius), HAND_COLOR, -1)
+    cv2.line(frame, (int(center[0]), int(center[1])), (int(wrist_end[0]), int(wrist_end[1])), HAND_COLOR, int(1.6 * palm_radius))
+
+    # Fingers are stretched in the order middle, index, ring, little, thumb
+    order = [2, 1, 3, 4, 0][:fingers]
+    tips = []
+    for index in sorted(order):
+        angle = np.deg2rad(FINGER_ANGLES[index])
+        length = palm_radius * (1 + FINGER_LENGTHS[index])
+        tip = rotate((center[0] + np.sin(angle) * length, center[1] - np.cos(angle) * length), center, rotation)
+        cv2.line(frame, (int(center[0]), int(center[1])), (int(tip[0]), int(tip[1])), HAND_COLOR, finger_width)
+        tips.append(tip)
+
+    if noise > 0:
+        frame = np.clip(frame + rng.normal(0, noise, frame.shape), 0, 255).astype(np.uint8)
+
+    return frame, np.array(tips, dtype=np.float64).reshape(-1, 2)
@@ -0,0 +1,185 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Accuracy and precision (degrees) per sample site of recorded accuracy tests (runs without Pupil)
+# Usage: python -m finger_detection.accuracy_analysis finger_accuracy_test_*.npz [-o accuracy.csv] [--sites]
+
+import argparse
+import csv
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+from . incremental_calibration import match_nearest
+from . sample_recorder import REFERENCE_DTYPE, GAZE_DTYPE
+
+OUTLIER_THRESHOLD = 5. # Degrees, matched gaze which is further away from the reference isn't used for accuracy and precision
+DEFAULT_FOCAL_LENGTH = 1000. # Pixels, used if the scene camera intrinsics are unknown (pinhole without distortion)
+
+# One row per sample site, site -1 is the whole session
+SITE_DTYPE = np.dtype([('site', 'i4'), ('start', 'f8'), ('end', 'f8'), ('screen_pos', 'f8', 2), ('samples', 'i4'), ('matched', 'i4'),
+                       ('inliers', 'i4'), ('accuracy', 'f8'), ('precision', 'f8')])
+COLUMNS = ['site', 'start', 'end', 'x', 'y', 'samples', 'matched', 'inliers', 'accuracy', 'precision']
+
+'''
+Returns the camera matrix of a pinhole camera with the given frame size (width, height) and focal length
+'''
+def default_camera_matrix(frame_size, focal_length=DEFAULT_FOCAL_LENGTH):
+    return np.array([[focal_length, 0, frame_size[0] / 2.], [0, focal_length, frame_size[1] / 2.], [0, 0, 1]])
+
+'''
+Returns the unit viewing directions of the given points (pixels) of the scene camera
+Distortion coefficients with 4 values are those of a fisheye camera (cv2.fisheye), others of the radial model
+'''
+def unproject(points, camera_matrix, dist_coefs):
+    points = np.ascontiguousarray(points, dtype=np.float64).reshape(-1, 1, 2)
+    if len(points) == 0:
+        return np.empty((0, 3))
+    camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+    dist_coefs = np.asarray(dist_coefs, dtype=np.float64)
+    if dist_coefs.size == 4:
+        undistorted = cv2.fisheye.undistortPoints(points, camera_matrix, dist_coefs.reshape(1, 4))
+    else:
+        undistorted = cv2.undistortPoints(points, camera_matrix, dist_coefs)
+    rays = np.concatenate([undistorted.reshape(-1, 2), np.ones((len(points), 1))], axis=1)
+    return rays / np.linalg.norm(rays, axis=1, keepdims=True)
+
+'''
+Returns the angles (degrees) between the rows of two arrays of unit vectors (atan2 is accurate for small angles as well)
+'''
+def angular_distance(a, b):
+    return np.degrees(np.arctan2(np.linalg.norm(np.cross(a, b), axis=1), (a * b).sum(axis=1)))
+
+'''
+Returns the group of every reference (0, 1, ...), a new group starts wherever the sample site changes
+'''
+def site_groups(sites):
+    groups = np.zeros(len(sites), dtype=np.intp)
+    np.cumsum(sites[1:] != sites[:-1], out=groups[1:])
+    return groups
+
+'''
+Matches every reference (REFERENCE_DTYPE) to the closest gaze datum (GAZE_DTYPE, both sorted by timestamp)
+and computes accuracy (mean angular error) and precision (RMS angular distance of successive matched gaze) per sample site
+Only gaze with at least min_confidence and errors below outlier_threshold (degrees) count, like in Pupil's accuracy visualizer
+Returns the sites (SITE_DTYPE), the session (SITE_DTYPE record with site -1) and the angular error of every reference (NaN if unmatched)
+'''
+def analyze(refs, gaze, frame_size, camera_matrix=None, dist_coefs=None, outlier_threshold=OUTLIER_THRESHOLD, min_confidence=0.):
+    if camera_matrix is None:
+        camera_matrix, dist_coefs = default_camera_matrix(frame_size), np.zeros(5)
+    gaze = gaze[gaze['confidence'] >= min_confidence]
+
+    closest, matched = match_nearest(gaze['timestamp'], refs['timestamp'])
+    gaze_pos = gaze['norm_pos'][closest] * frame_size if len(gaze) > 0 else np.zeros((len(refs), 2))
+    gaze_pos[:, 1] = frame_size[1] - gaze_pos[:, 1]
+    gaze_rays = unproject(gaze_pos, camera_matrix, dist_coefs)
+    errors = angular_distance(unproject(refs['screen_pos'], camera_matrix, dist_coefs), gaze_rays)
+    errors[~matched] = np.nan
+    inliers = matched & (errors < outlier_threshold)
+
+    # Successive gaze samples are paired within a site only
+    groups = site_groups(refs['site'])
+    pairs = inliers[1:] & inliers[:-1] & (groups[1:] == groups[:-1])
+    pair_distances = angular_distance(gaze_rays[1:][pairs], gaze_rays[:-1][pairs])
+    pair_groups = groups[1:][pairs]
+
+    starts = np.flatnonzero(np.diff(groups, prepend=-1))
+    ends = np.append(starts[1:], len(refs))[:len(starts)] - 1
+    count = len(starts)
+    sites = np.zeros(count, dtype=SITE_DTYPE)
+    sites['site'] = refs['site'][starts]
+    sites['start'] = refs['timestamp'][starts]
+    sites['end'] = refs['timestamp'][ends]
+    sites['samples'] = np.bincount(groups, minlength=count)
+    sites['screen_pos'] = np.stack([np.bincount(groups, refs['screen_pos'][:, axis], count) for axis in (0, 1)], axis=1) / np.maximum(sites['samples'], 1)[:, None]
+    sites['matched'] = np.bincount(groups, matched, count)
+    sites['inliers'] = np.bincount(groups, inliers, count)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sites['accuracy'] = np.bincount(groups[inliers], errors[inliers], count) / sites['inliers']
+        sites['precision'] = np.sqrt(np.bincount(pair_groups, pair_distances ** 2, count) / np.bincount(pair_groups, minlength=count))
+
+    session = np.zeros((), dtype=SITE_DTYPE)
+    session['site'] = -1
+    if len(refs) > 0:
+        session['start'], session['end'] = refs['timestamp'][0], refs['timestamp'][-1]
+        session['screen_pos'] = refs['screen_pos'].mean(axis=0)
+    session['samples'], session['matched'], session['inliers'] = len(refs), matched.sum(), inliers.sum()
+    session['accuracy'] = errors[inliers].mean() if inliers.any() else np.nan
+    session['precision'] = np.sqrt((pair_distances ** 2).mean()) if len(pair_distances) > 0 else np.nan
+    return sites, session, errors
+
+'''
+Stores the references, gaze and camera of an accuracy test as columns of an .npz file
+'''
+def save_session(path, refs, gaze, frame_size, camera_matrix=None, dist_coefs=None):
+    columns = {'ref_' + name: refs[name] for name in REFERENCE_DTYPE.names}
+    columns.update({'gaze_' + name: gaze[name] for name in GAZE_DTYPE.names})
+    if camera_matrix is not None:
+        columns.update(camera_matrix=np.asarray(camera_matrix, dtype=np.float64), dist_coefs=np.asarray(dist_coefs, dtype=np.float64))
+    np.savez_compressed(path, frame_size=np.array(frame_size, dtype=np.int64), **columns)
+
+'''
+Returns the references, gaze, frame size, camera matrix and distortion coefficients (None if unknown) stored by save_session
+'''
+def load_session(path):
+    data = np.load(path)
+    records = []
+    for prefix, dtype in (('ref_', REFERENCE_DTYPE), ('gaze_', GAZE_DTYPE)):
+        columns = np.zeros(len(data[prefix + 'timestamp']), dtype=dtype)
+        for name in dtype.names:
+            columns[name] = data[prefix + name]
+        records.append(columns)
+    camera_matrix = data['camera_matrix'] if 'camera_matrix' in data else None
+    dist_coefs = data['dist_coefs'] if 'dist_coefs' in data else None
+    return records[0], records[1], tuple(data['frame_size']), camera_matrix, dist_coefs
+
+def rows(sites):
+    for site in sites:
+        yield [int(site['site']), site['start'], site['end'], site['screen_pos'][0], site['screen_pos'][1],
+               int(site['samples']), int(site['matched']), int(site['inliers']), site['accuracy'], site['precision']]
+
+'''
+Writes the sites and the session (site -1) of every session as CSV, sessions is a list of (name, sites, session)
+'''
+def save_results(path, sessions):
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['session'] + COLUMNS)
+        for name, sites, session in sessions:
+            for row in rows(np.append(sites, session)):
+                writer.writerow([name] + row)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compute accuracy and precision per sample site of recorded finger accuracy tests.')
+    parser.add_argument('sessions', nargs='+', help='.npz files stored by the plugin after accuracy tests')
+    parser.add_argument('-o', '--output', help='output .csv file with the sites and totals of all sessions')
+    parser.add_argument('--outlier-threshold', type=float, default=OUTLIER_THRESHOLD, help='angular error (degrees) above which matched gaze is an outlier')
+    parser.add_argument('--min-confidence', type=float, default=0., help='gaze with lower confidence is ignored')
+    parser.add_argument('--sites', action='store_true', help='print every sample site, not only the totals')
+    args = parser.parse_args(argv)
+
+    results = []
+    start = time.perf_counter()
+    for path in args.sessions:
+        refs, gaze, frame_size, camera_matrix, dist_coefs = load_session(path)
+        sites, session, _ = analyze(refs, gaze, frame_size, camera_matrix, dist_coefs, args.outlier_threshold, args.min_confidence)
+        results.append((os.path.splitext(os.path.basename(path))[0], sites, session))
+    duration = time.perf_counter() - start
+
+    print('{:>40} {:>6} {:>8} {:>8} {:>8} {:>8} {:>15} {:>15}'.format('session', 'site', 'samples', 'matched', 'inliers', 'sites', 'accuracy [deg]', 'precision [deg]'))
+    for name, sites, session in results:
+        for site in (np.append(sites, session) if args.sites else [session]):
+            print('{:>40} {:>6} {:>8} {:>8} {:>8} {:>8} {:>15.3f} {:>15.3f}'.format(name, 'all' if site['site'] < 0 else site['site'],
+                  site['samples'], site['matched'], site['inliers'], len(sites) if site['site'] < 0 else '', site['accuracy'], site['precision']))
+    print('Analyzed {} sessions in {:.2f} seconds'.format(len(results), duration))
+
+    if args.output:
+        save_results(args.output, results)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,212 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Offline fingertip detection over recorded world videos or image directories (runs without Pupil)
+# Usage: python -m finger_detection.batch_detection world.mp4 [-o world_fingertips.npz]
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import sys
+import time
+import cv2
+import numpy as np
+
+from . finger_detection import Finger_Detection
+from . color_segmentation import Color_Segmentation
+from . frame_buffers import Frame_Buffers
+from . detection_cache import Detection_Cache, DEFAULT_BUDGET, cache_key, recording_id
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff')
+QUEUE_SIZE_PER_WORKER = 4
+
+# Same defaults as Finger_Calibration (h, s, v, tolerance_h, tolerance_s, tolerance_v)
+DEFAULT_COLOR = [20, 36, 62, 20, 24, 38]
+DEFAULT_THRESHOLD = 30
+DEFAULT_CORRECTION_SCALE = 25
+
+# Per process state of the workers
+worker_segmentation = None
+worker_buffers = None
+
+'''
+Yields (timestamp, frame) of a video or of all images in a directory (sorted by name)
+Video timestamps are read from Pupil's <name>_timestamps.npy if it exists, images are timestamped by their index
+'''
+def read_frames(path):
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        for index, name in enumerate(names):
+            frame = cv2.imread(os.path.join(path, name))
+            if frame is not None:
+                yield float(index), frame
+        return
+
+    timestamps_path = os.path.splitext(path)[0] + '_timestamps.npy'
+    timestamps = np.load(timestamps_path) if os.path.exists(timestamps_path) else None
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise IOError('Could not open {}'.format(path))
+
+    index = 0
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+
+        if timestamps is not None and index < len(timestamps):
+            timestamp = float(timestamps[index])
+        else:
+            timestamp = capture.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        index += 1
+
+        yield timestamp, frame
+
+    capture.release()
+
+def init_worker():
+    global worker_segmentation, worker_buffers
+    worker_segmentation = Color_Segmentation()
+    worker_buffers = Frame_Buffers()
+
+'''
+Returns (fingertips, hand contour) of a single frame
+'''
+def detect(frame, threshold, color_threshold, finger_correction_scale, pyramid):
+    find = Finger_Detection.findFingersPyramid if pyramid else Finger_Detection.findFingers
+    return find(frame, threshold, color_threshold, finger_correction_scale, worker_segmentation, worker_buffers)
+
+'''
+Runs the detection on all frames with a process pool, at most queue_size frames are decoded ahead of the detection
+Frames found in the cache (a Detection_Cache) aren't detected again, detected frames are added to it
+Returns the per frame results in frame order
+'''
+def run(path, threshold, color_threshold, finger_correction_scale, workers, queue_size, pyramid=False, cache=None):
+    timestamps = []
+    areas = []
+    tips = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        pending = collections.deque()
+
+        def collect():
+            timestamp, result = pending.popleft()
+            if isinstance(result, concurrent.futures.Future):
+                result = result.result()
+                if cache is not None:
+                    cache.put(timestamp, *result)
+            fingers, contour = result
+            timestamps.append(timestamp)
+            areas.append(cv2.contourArea(contour) if len(contour) > 0 else 0.)
+            tips.append(np.array(fingers, dtype=np.int32).reshape(-1, 2))
+
+        for timestamp, frame in read_frames(path):
+            if len(pending) >= queue_size:
+                collect()
+            result = cache.get(timestamp) if cache is not None else None
+            if result is None:
+                result = pool.submit(detect, frame, threshold, color_threshold, finger_correction_scale, pyramid)
+            pending.append((timestamp, result))
+
+        while pending:
+            collect()
+
+    return timestamps, areas, tips
+
+'''
+Same as run, but the frames are decoded in stacks of batch_size frames which are detected by Finger_Detection.findFingersBatch
+(one segmentation pass per stack, worker threads instead of processes, the frames aren't copied to other processes)
+'''
+def run_batched(path, threshold, color_threshold, finger_correction_scale, workers, batch_size, cache=None):
+    timestamps = []
+    areas = []
+    tips = []
+    segmentation = Color_Segmentation()
+    buffers = Frame_Buffers()
+    batch = []
+
+    def detect_batch():
+        results = [cache.get(timestamp) if cache is not None else None for timestamp, _ in batch]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            stack = np.stack([batch[index][1] for index in missing])
+            batch_tips, hands, contours = Finger_Detection.findFingersBatch(stack, threshold, color_threshold, finger_correction_scale, segmentation, buffers, workers, return_contours=True)
+            for index, hand, contour in zip(missing, hands, contours):
+                fingers = batch_tips['position'][hand['tip_offset']:hand['tip_offset'] + hand['tip_count']].tolist()
+                results[index] = (fingers, contour)
+                if cache is not None:
+                    cache.put(batch[index][0], fingers, contour)
+
+        for (timestamp, _), (fingers, contour) in zip(batch, results):
+            timestamps.append(timestamp)
+            areas.append(cv2.contourArea(contour) if len(contour) > 0 else 0.)
+            tips.append(np.array(fingers, dtype=np.int32).reshape(-1, 2))
+        del batch[:]
+
+    for timestamp, frame in read_frames(path):
+        batch.append((timestamp, frame))
+        if len(batch) == batch_size:
+            detect_batch()
+    if batch:
+        detect_batch()
+
+    return timestamps, areas, tips
+
+'''
+Stores one record per frame: timestamp, contour area and the fingertips (x, y) in pixels
+Tips of frame i are tips[tip_offsets[i]:tip_offsets[i+1]]
+'''
+def save(output, timestamps, areas, tips):
+    tip_counts = np.array([len(frame_tips) for frame_tips in tips], dtype=np.int32)
+    np.savez_compressed(output,
+        timestamp=np.array(timestamps, dtype=np.float64),
+        contour_area=np.array(areas, dtype=np.float32),
+        tip_offsets=np.concatenate([[0], np.cumsum(tip_counts)]).astype(np.int64),
+        tips=np.concatenate(tips) if tips else np.empty((0, 2), dtype=np.int32))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Detect fingertips in a recorded world video or an image directory.')
+    parser.add_argument('input', help='video file or directory of images')
+    parser.add_argument('-o', '--output', help='output .npz file (default: <input>_fingertips.npz)')
+    parser.add_argument('--color', type=float, nargs=6, default=DEFAULT_COLOR, metavar=('H', 'S', 'V', 'RANGE_H', 'RANGE_S', 'RANGE_V'),
+        help='hand color and tolerances as in the plugin menu (hue in degrees, saturation and value in percent)')
+    parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD, help='mask threshold after blurring')
+    parser.add_argument('--correction-scale', type=float, default=DEFAULT_CORRECTION_SCALE, help='finger correction scale in pixels')
+    parser.add_argument('--pyramid', action='store_true', help='search the hand at lower resolution and refine the fingertips at full resolution')
+    parser.add_argument('--cache', help='directory of the detection cache, frames detected before with the same parameters are read from it')
+    parser.add_argument('--cache-budget', type=float, default=DEFAULT_BUDGET / 1024 ** 2, help='disk space (MB) of the cache directory')
+    parser.add_argument('--batch', type=int, metavar='SIZE', help='detect stacks of SIZE frames with worker threads instead of single frames with worker processes')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of detection processes or threads (default: number of cores)')
+    args = parser.parse_args(argv)
+    if args.batch and args.pyramid:
+        parser.error('--batch can\'t be combined with --pyramid')
+
+    output = args.output or os.path.splitext(os.path.normpath(args.input))[0] + '_fingertips.npz'
+    color_threshold = Color_Segmentation.normalizeThreshold(*args.color)
+
+    cache = None
+    if args.cache:
+        key = cache_key(recording_id(args.input), 'frame', args.threshold, color_threshold, args.correction_scale, args.pyramid)
+        cache = Detection_Cache(args.cache, key, int(args.cache_budget * 1024 ** 2))
+
+    start = time.perf_counter()
+    if args.batch:
+        timestamps, areas, tips = run_batched(args.input, args.threshold, color_threshold, args.correction_scale, args.workers, args.batch, cache)
+    else:
+        timestamps, areas, tips = run(args.input, args.threshold, color_threshold, args.correction_scale, args.workers, args.workers * QUEUE_SIZE_PER_WORKER, args.pyramid, cache)
+    duration = time.perf_counter() - start
+    if cache is not None:
+        cache.save()
+
+    save(output, timestamps, areas, tips)
+
+    fps = len(timestamps) / duration if duration > 0 else 0.
+    print('Processed {} frames in {:.1f} seconds ({:.1f} fps), results stored in {}'.format(len(timestamps), duration, fps, output))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,188 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import cv2
+import numpy as np
+
+# Adaptive color model (all HSV values in OpenCV units)
+ADAPTATION_RATE = 0.05 # Forgetting factor, weight of the newest hand pixels in the color model
+MODEL_WIDTH = 2.5 # The threshold covers the mean +/- MODEL_WIDTH standard deviations of the hand color
+MIN_TOLERANCE = np.array([3., 10., 10.])
+MAX_TOLERANCE = np.array([45., 128., 128.])
+UPDATE_STEP = 8 # Only every UPDATE_STEP-th pixel (in both directions) of the hand updates the model
+UPDATE_EROSION = np.ones((3, 3), np.uint8) # Removes the border of the hand (may contain background) before the update
+MIN_UPDATE_PIXELS = 50
+
+# Lookup table segmentation
+MAX_LUT_BITS = 7 # The table index of a color (see buildLut) has to fit into int16
+LUT_BLOCK_ROWS = 8192 # cv2.remap only handles images with less than 32767 rows, taller images (stacks of frames) are looked up in blocks
+
+class Color_Segmentation():
+
+    '''
+    Thresholds frames by their HSV color
+    Everything that only depends on the color threshold is computed once and reused until the threshold changes.
+    With lut_bits set, the mask of all colors quantized to lut_bits per channel is precomputed when the threshold changes
+    and frames are segmented by one table lookup instead of the HSV conversion (the mask is approximate, see benchmarks/segmentation_benchmark.py)
+    '''
+    def __init__(self, lut_bits=None):
+        if lut_bits is not None and not 1 <= lut_bits <= MAX_LUT_BITS:
+            raise ValueError('lut_bits must be between 1 and {}, got {}'.format(MAX_LUT_BITS, lut_bits))
+        self.lut_bits = lut_bits
+        self.color_threshold = None
+        self.ranges = []
+        self.lut = None
+        self.lut_threshold = None
+        self.quantization = None
+
+    '''
+    Normalizes HSV color specs (h in degrees, s and v in percent) to OpenCV HSV color specs
+    '''
+    def normalizeThreshold(h, s, v, tolerance_h, tolerance_s, tolerance_v):
+        return [h/2, s * 2.55, v * 2.55, tolerance_h/2, tolerance_s * 2.55, tolerance_v * 2.55]
+
+    '''
+    Returns the HSV ranges (lower and upper bound) covered by the color threshold
+    Colors need to be normalized to OpenCVs HSV norm (e.g., h is between 0 and 180)
+    '''
+    def getRanges(segmentation_color):
+        h, s, v, tolerance_h, tolerance_s, tolerance_v = segmentation_color
+
+        if h >= tolerance_h and (h+tolerance_h) <= 180:
+            # E.g. h=50 and tolerance_h=10 -> valid range is [40, 60]
+            return [(np.array([h - tolerance_h, s - tolerance_s, v - tolerance_v]), np.array([h + tolerance_h, s + tolerance_s, v + tolerance_v]))]
+        elif h < tolerance_h:
+            # E.g. h=10 and tolerance_h=20 -> valid range is [350, 360] and [0,30]
+            return [(np.array([0, s - tolerance_s, v - tolerance_v]), np.array([h + tolerance_h, s + tolerance_s, v + tolerance_v])),
+                    (np.array([180 - (tolerance_h - h), s - tolerance_s, v - tolerance_v]), np.array([180, s + tolerance_s, v + tolerance_v]))]
+        else:
+            # E.g. h=350 and tolerance_h=20 -> valid range is [330, 360] and [0,10]
+            return [(np.array([h - tolerance_h, s - tolerance_s, v - tolerance_v]), np.array([180, s + tolerance_s, v + tolerance_v])),
+                    (np.array([0, s - tolerance_s, v - tolerance_v]), np.array([0 + (h+tolerance_h-180), s + tolerance_s, v + tolerance_v]))]
+
+    def setThreshold(self, segmentation_color):
+        color_threshold = tuple(segmentation_color)
+        if color_threshold != self.color_threshold:
+            self.color_threshold = color_threshold
+            self.ranges = Color_Segmentation.getRanges(color_threshold)
+
+        if self.lut_bits is not None and self.lut_threshold != self.color_threshold:
+            self.buildLut()
+
+    '''
+    Thresholds the center color of every quantization bin
+    The table is an image in which the quantized color (b, g, r) is at x = b + 256 * g and y = r, which is the layout
+    of a quantized BGRA pixel (alpha 0) read as a pair of int16 values
+    '''
+    def buildLut(self):
+        bins = 1 << self.lut_bits
+        shift = 8 - self.lut_bits
+        centers = (np.arange(bins) << shift) + (1 << shift >> 1)
+        columns = (np.arange(bins) + 256 * np.arange(bins)[:, None]).ravel()
+        colors = np.zeros((bins, columns[-1] + 1, 3), np.uint8)
+        colors[:, columns, 0] = np.tile(centers, bins)
+        colors[:, columns, 1] = np.repeat(centers, bins)
+        colors[:, columns, 2] = centers[:, None]
+        self.lut = self.thresholdHSV(cv2.cvtColor(colors, cv2.COLOR_BGR2HSV))
+
+        # Maps every channel value to its bin and alpha to 0
+        self.quantization = np.zeros((1, 256, 4), np.uint8)
+        self.quantization[0, :, :3] = (np.arange(256) >> shift)[:, None]
+        self.lut_threshold = self.color_threshold
+
+    def thresholdHSV(self, hsv, buffers=None):
+        shape = hsv.shape[:2]
+        mask = cv2.inRange(hsv, self.ranges[0][0], self.ranges[0][1], dst=buffers.get('color_mask', shape) if buffers is not None else None)
+        for lower, upper in self.ranges[1:]:
+            wrapped = cv2.inRange(hsv, lower, upper, dst=buffers.get('color_mask_wrapped', shape) if buffers is not None else None)
+            mask = cv2.bitwise_or(mask, wrapped, dst=mask)
+        return mask
+
+    '''
+    Returns the binary mask (0 or 255) of all pixels within the color threshold
+    With Frame_Buffers, the mask and the intermediate images are written into them (the mask is overwritten by the next call)
+    '''
+    def getMask(self, frame, segmentation_color, buffers=None):
+        self.setThreshold(segmentation_color)
+        shape = frame.shape[:2]
+
+        if self.lut_bits is not None:
+            bgra = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA, dst=buffers.get('bgra', shape + (4,)) if buffers is not None else None)
+            cv2.LUT(bgra, self.quantization, dst=bgra)
+            # Read as int16 pairs, the quantized pixels are the positions of their colors in the table
+            positions = bgra.view(np.int16)
+            mask = buffers.get('color_mask', shape) if buffers is not None else np.empty(shape, np.uint8)
+            for row in range(0, shape[0], LUT_BLOCK_ROWS):
+                cv2.remap(self.lut, positions[row:row + LUT_BLOCK_ROWS], None, cv2.INTER_NEAREST, dst=mask[row:row + LUT_BLOCK_ROWS])
+            return mask
+
+        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=buffers.get('hsv', shape + (3,)) if buffers is not None else None)
+        return self.thresholdHSV(hsv, buffers)
+
+    '''
+    Called with the frame and the contour of every accepted hand, the fixed threshold ignores it
+    '''
+    def update(self, frame, contour):
+        pass
+
+class Adaptive_Color_Segmentation(Color_Segmentation):
+
+    '''
+    Learns the hand color while detecting: a Gaussian per HSV channel (hue on the circle) which is seeded from the color threshold
+    (click or preset) and updated from the pixels inside the accepted hand contours with a forgetting factor
+    Frames are thresholded by the box mean +/- MODEL_WIDTH standard deviations, which costs the same as the fixed threshold
+    '''
+    def __init__(self):
+        super().__init__()
+        self.seed = None
+        self.mean = None
+        self.variance = None
+
+    def getMask(self, frame, segmentation_color, buffers=None):
+        seed = tuple(segmentation_color)
+        if seed != self.seed:
+            # New color chosen by the user, start over from it
+            self.seed = seed
+            self.mean = np.array(seed[:3], dtype=np.float64)
+            self.variance = (np.array(seed[3:], dtype=np.float64) / MODEL_WIDTH) ** 2
+
+        return super().getMask(frame, self.getThreshold(), buffers)
+
+    '''
+    Returns the current color threshold of the model (same format as Color_Segmentation.normalizeThreshold)
+    '''
+    def getThreshold(self):
+        tolerance = np.clip(np.sqrt(self.variance) * MODEL_WIDTH, MIN_TOLERANCE, MAX_TOLERANCE)
+        return [float(value) for value in np.concatenate([self.mean, tolerance])]
+
+    def update(self, frame, contour):
+        if self.mean is None or len(contour) == 0:
+            return
+
+        # Pixels inside the (eroded) contour on a coarse grid
+        x, y, w, h = cv2.boundingRect(contour)
+        region = np.ascontiguousarray(frame[y:y+h:UPDATE_STEP, x:x+w:UPDATE_STEP])
+        mask = np.zeros(region.shape[:2], np.uint8)
+        # drawContours only accepts int32 points, NumPy before 2.0 upcasts the int32 contour minus the Python ints to int64
+        cv2.drawContours(mask, [((contour - (x, y)) // UPDATE_STEP).astype(np.int32)], 0, 255, -1)
+        mask = cv2.erode(mask, UPDATE_EROSION)
+        pixels = cv2.cvtColor(region, cv2.COLOR_BGR2HSV)[mask > 0].astype(np.float64)
+
+        # Deviations from the model, hue wraps around at 180
+        deviation = pixels - self.mean
+        deviation[:, 0] = (deviation[:, 0] + 90) % 180 - 90
+
+        # Pixels far outside the current threshold are background within the contour
+        tolerance = np.array(self.getThreshold()[3:])
+        deviation = deviation[(np.abs(deviation) <= 2 * tolerance).all(axis=1)]
+        if len(deviation) < MIN_UPDATE_PIXELS:
+            return
+
+        # Blend the model with the statistics of the new pixels
+        delta = deviation.mean(axis=0)
+        self.variance = (1 - ADAPTATION_RATE) * self.variance + ADAPTATION_RATE * deviation.var(axis=0) + ADAPTATION_RATE * (1 - ADAPTATION_RATE) * delta ** 2
+        self.mean = self.mean + ADAPTATION_RATE * delta
+        self.mean[0] %= 180
@@ -0,0 +1,147 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import hashlib
+import os
+import numpy as np
+
+CACHE_VERSION = 1 # Part of every key, increase when the detection results change
+DEFAULT_BUDGET = 1024 ** 3 # Disk space (bytes) of a cache directory, least recently used files beyond it are deleted
+EXTENSION = '.npz'
+
+'''
+Returns a short hash of the given parameters (anything with a deterministic repr, e.g. numbers, strings and lists of them)
+'''
+def cache_key(*parameters):
+    return hashlib.sha1(repr((CACHE_VERSION,) + parameters).encode('utf-8')).hexdigest()[:16]
+
+'''
+Returns the parameters which identify a recording: its path, size and modification time
+For a directory of images the name, size and modification time of every file in it are used (adding, removing or editing an image changes them)
+'''
+def recording_id(path):
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        files = sorted((entry.name, entry.stat().st_size, entry.stat().st_mtime) for entry in os.scandir(path) if entry.is_file())
+        return (path, tuple(files))
+    return (path, os.path.getsize(path), os.path.getmtime(path))
+
+'''
+Deletes the least recently used cache files of the directory until they fit into the budget (bytes), keep is never deleted
+'''
+def evict(directory, budget, keep=None):
+    files = []
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(EXTENSION) and os.path.isfile(path):
+            files.append((os.path.getmtime(path), os.path.getsize(path), path))
+
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= budget:
+            break
+        if path != keep:
+            os.remove(path)
+            total -= size
+
+'''
+Returns the indices which reorder consecutive segments of the given lengths (counts) into the given order of segments
+'''
+def segment_order(counts, order):
+    starts = np.cumsum(counts) - counts
+    counts = counts[order]
+    return np.repeat(starts[order] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+
+class Detection_Cache():
+
+    '''
+    Detections (fingertips and hand contour) of one recording with one set of detection parameters (see cache_key),
+    stored in a columnar file: sorted frame timestamps, all tips and all contour points, with offsets per frame
+    Frames are looked up by timestamp, new detections are kept in memory until save()
+    The file's modification time is its last use, which is what the eviction by disk budget goes by
+    '''
+    def __init__(self, directory, key, budget=DEFAULT_BUDGET):
+        self.directory = directory
+        self.path = os.path.join(directory, key + EXTENSION)
+        self.budget = budget
+        self.timestamps = None
+        self.new = {}
+
+    def __len__(self):
+        self.load()
+        return len(self.timestamps) + len(self.new)
+
+    def load(self):
+        if self.timestamps is not None:
+            return
+        if os.path.exists(self.path):
+            data = np.load(self.path)
+            self.timestamps = data['timestamp']
+            self.tip_offsets = data['tip_offsets']
+            self.tips = data['tips']
+            self.contour_offsets = data['contour_offsets']
+            self.contours = data['contours']
+            os.utime(self.path)
+        else:
+            self.timestamps = np.empty(0)
+            self.tip_offsets = self.contour_offsets = np.zeros(1, dtype=np.int64)
+            self.tips = self.contours = np.empty((0, 2), dtype=np.int32)
+
+    '''
+    Returns the (fingers, contour) detected in the frame with the given timestamp (as returned by findFingers), or None
+    '''
+    def get(self, timestamp):
+        result = self.new.get(timestamp)
+        if result is not None:
+            return result
+
+        self.load()
+        index = int(np.searchsorted(self.timestamps, timestamp))
+        if index == len(self.timestamps) or self.timestamps[index] != timestamp:
+            return None
+        fingers = self.tips[self.tip_offsets[index]:self.tip_offsets[index + 1]].tolist()
+        contour = self.contours[self.contour_offsets[index]:self.contour_offsets[index + 1]].reshape(-1, 1, 2)
+        return fingers, contour
+
+    def put(self, timestamp, fingers, contour):
+        self.new[timestamp] = (np.array(fingers, dtype=np.int32).reshape(-1, 2).tolist(), np.array(contour, dtype=np.int32).reshape(-1, 1, 2))
+
+    '''
+    Merges the new detections into the file and evicts the least recently used files of the directory beyond the budget
+    '''
+    def save(self):
+        if not self.new:
+            return
+        self.load()
+
+        # Stored frames which were detected again are replaced
+        stored = ~np.isin(self.timestamps, list(self.new.keys()))
+        tip_counts = np.diff(self.tip_offsets)
+        contour_counts = np.diff(self.contour_offsets)
+        timestamps = np.concatenate([self.timestamps[stored], list(self.new.keys())])
+        tips = [self.tips[np.repeat(stored, tip_counts)]] + [np.array(fingers, dtype=np.int32).reshape(-1, 2) for fingers, _ in self.new.values()]
+        contours = [self.contours[np.repeat(stored, contour_counts)]] + [contour.reshape(-1, 2) for _, contour in self.new.values()]
+        tip_counts = np.concatenate([tip_counts[stored], [len(fingers) for fingers, _ in self.new.values()]]).astype(np.int64)
+        contour_counts = np.concatenate([contour_counts[stored], [len(contour) for _, contour in self.new.values()]]).astype(np.int64)
+
+        # Frames are stored in timestamp order, the tips and contour points are reordered along
+        order = np.argsort(timestamps, kind='stable')
+        tips = np.concatenate(tips)[segment_order(tip_counts, order)]
+        contours = np.concatenate(contours)[segment_order(contour_counts, order)]
+
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = self.path[:-len(EXTENSION)] + '.tmp' + EXTENSION
+        np.savez_compressed(temporary_path,
+            timestamp=timestamps[order].astype(np.float64),
+            tip_offsets=np.concatenate([[0], np.cumsum(tip_counts[order])]).astype(np.int64),
+            tips=tips,
+            contour_offsets=np.concatenate([[0], np.cumsum(contour_counts[order])]).astype(np.int64),
+            contours=contours)
+        os.replace(temporary_path, self.path)
+
+        self.timestamps = None
+        self.new = {}
+        evict(self.directory, self.budget, keep=self.path)
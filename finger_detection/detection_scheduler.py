@@ -0,0 +1,52 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import cv2
+
+PROBE_RADIUS = 40 # Half size (pixels) of the square around the fingertip which is checked for motion
+MOTION_THRESHOLD = 8. # Mean absolute gray value difference of the probe above which the finger counts as moving
+MAX_SKIPPED_FRAMES = 4 # Frames in a row which may be skipped, the next one is detected in any case
+
+class Detection_Scheduler():
+
+    '''
+    Decides for every frame whether the full finger detection has to run
+    While a static finger is sampled the marker is frozen, so the detection only keeps the fingertip track and the contour up to date:
+    frames are only detected if the neighborhood of the fingertip changed since the last detected frame (frame differencing)
+    or after MAX_SKIPPED_FRAMES skipped frames. Otherwise every frame is detected.
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.probe = None
+        self.region = None
+        self.skipped = 0
+
+    '''
+    Returns whether the frame has to be detected, tip is the fingertip (pixels) which is sampled, sampling whether a static finger is sampled
+    '''
+    def should_detect(self, frame, tip, sampling):
+        if not sampling or tip is None:
+            self.probe = None
+            return True
+
+        if self.probe is not None and self.skipped < MAX_SKIPPED_FRAMES:
+            x0, y0, x1, y1 = self.region
+            probe = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            if cv2.absdiff(probe, self.probe).mean() <= MOTION_THRESHOLD:
+                self.skipped += 1
+                return False
+
+        # The detected frame is the reference of the following frames
+        frame_height, frame_width = frame.shape[:2]
+        x, y = int(round(tip[0])), int(round(tip[1]))
+        self.region = (min(max(x - PROBE_RADIUS, 0), frame_width - 1), min(max(y - PROBE_RADIUS, 0), frame_height - 1),
+                       max(min(x + PROBE_RADIUS, frame_width), 1), max(min(y + PROBE_RADIUS, frame_height), 1))
+        x0, y0, x1, y1 = self.region
+        self.probe = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        self.skipped = 0
+        return True
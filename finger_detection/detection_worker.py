@@ -0,0 +1,90 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import threading
+
+from . finger_detection import Finger_Tracker
+
+class Detection_Worker():
+
+    '''
+    Runs the finger detection in a background thread (OpenCV releases the GIL while it processes a frame)
+    Only the newest frame is detected, frames which are submitted while the worker is busy replace each other
+    Submitted frames are not copied and must not be modified afterwards
+    buffers (Frame_Buffers) are used by the worker thread only
+    '''
+    def __init__(self, buffers=None):
+        self.tracker = Finger_Tracker(buffers=buffers)
+        self.condition = threading.Condition()
+        self.pending = None
+        self.result = None
+        self.generation = 0
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.run, name='Finger detection', daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            with self.condition:
+                self.running = False
+                self.condition.notify()
+            self.thread.join()
+            self.thread = None
+
+        self.pending = None
+        self.result = None
+
+    '''
+    Drops all pending frames and results, a detection which is running right now is discarded once it finishes
+    '''
+    def reset(self):
+        with self.condition:
+            self.pending = None
+            self.result = None
+            self.generation += 1
+            self.tracker.reset()
+
+    '''
+    Queues a frame for detection, replaces any frame which hasn't been picked up by the worker yet
+    '''
+    def submit(self, frame, timestamp, threshold, segmentation_color, finger_correction_scale):
+        self.start()
+        with self.condition:
+            self.pending = (frame, timestamp, threshold, segmentation_color, finger_correction_scale)
+            self.condition.notify()
+
+    '''
+    Returns (fingers, contour, timestamp) of the newest completed detection, or None if there is no new result
+    Every result is only returned once, timestamp is the timestamp of the frame it was detected in
+    '''
+    def poll(self):
+        with self.condition:
+            result = self.result
+            self.result = None
+        return result
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and self.pending is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+
+                frame, timestamp, threshold, segmentation_color, finger_correction_scale = self.pending
+                self.pending = None
+                generation = self.generation
+
+            fingers, contour = self.tracker.findFingers(frame, threshold, segmentation_color, finger_correction_scale)
+
+            with self.condition:
+                if generation == self.generation:
+                    self.result = (fingers, contour, timestamp)
@@ -4,47 +4,107 @@ Copyright (C) 2017-2018  Sander Staal
 ---------------------------------------------------------------------------~(*)
 '''
 
-class DisjointSet:
+import numpy as np
 
-	disjoint_set = list()
-	set_member_lookup = {}
+class DisjointSet:
 
+	'''
+	Union-find over the given items, backed by a parent array (union by rank and path compression)
+	'''
 	def __init__(self, init_arr):
-		self.disjoint_set = []
-		self.set_member_lookup = {}
+		self.items = list(dict.fromkeys(init_arr)) if init_arr else []
+		self.set_member_lookup = {item: index for index, item in enumerate(self.items)}
+
+		# Items 0..n-1 can be used as indices directly
+		self.identity = all(type(item) is int and item == index for index, item in enumerate(self.items))
+
+		self.parent = np.arange(len(self.items))
+		self.rank = np.zeros(len(self.items), dtype=np.intp)
 
-		if init_arr:
-			for index, item in enumerate(set(init_arr)):
-				self.disjoint_set.append([item])
-				self.set_member_lookup[item] = index
+	def indices(self, elems):
+		if self.identity:
+			return np.asarray(elems, dtype=np.intp).ravel()
+		return np.array([self.set_member_lookup[e] for e in elems], dtype=np.intp)
+
+	'''
+	Returns the root index of all given item indices, paths are compressed by pointer jumping
+	'''
+	def root_indices(self, indices):
+		while True:
+			roots = self.parent[indices]
+			if np.array_equal(self.parent[roots], roots):
+				return roots
+			self.parent = self.parent[self.parent]
 
 	def find(self, elem):
-		if elem in self.set_member_lookup:
-			return self.set_member_lookup[elem]
-		else:
+		if elem not in self.set_member_lookup:
 			return None
-	
+
+		index = self.set_member_lookup[elem]
+		root = index
+		while self.parent[root] != root:
+			root = self.parent[root]
+
+		# Path compression
+		while self.parent[index] != root:
+			self.parent[index], index = root, self.parent[index]
+
+		return int(root)
+
 	def union(self, elem1, elem2):
-		index_elem1 = self.find(elem1)
-		index_elem2 = self.find(elem2)
+		root1 = self.find(elem1)
+		root2 = self.find(elem2)
 
-		if self.disjoint_set[index_elem1] is None or self.disjoint_set[index_elem2] is None:
-			return self.disjoint_set
+		if root1 is None or root2 is None or root1 == root2:
+			return
 
-		if index_elem1 is None or index_elem2 is None:
-			return self.disjoint_set
+		if self.rank[root1] > self.rank[root2]:
+			root1, root2 = root2, root1
 
-		if index_elem1 != index_elem2:
-			self.disjoint_set[index_elem2].extend(list(self.disjoint_set[index_elem1]))
-			
-			for k in self.disjoint_set[index_elem1]:
-				self.set_member_lookup[k] = index_elem2
+		self.parent[root1] = root2
+		if self.rank[root1] == self.rank[root2]:
+			self.rank[root2] += 1
 
-			self.disjoint_set[index_elem1] = None
+	'''
+	Merges the sets of u_array[i] and v_array[i] for all i at once
+	'''
+	def union_pairs(self, u_array, v_array):
+		u = self.indices(u_array)
+		v = self.indices(v_array)
 
-		return self.disjoint_set	
+		while len(u) > 0:
+			root_u = self.root_indices(u)
+			root_v = self.root_indices(v)
 
-	def get(self):
-		return [e for e in self.disjoint_set if e is not None]
-	
+			pending = root_u != root_v
+			if not pending.any():
+				break
+
+			u, v = u[pending], v[pending]
+			root_u, root_v = root_u[pending], root_v[pending]
+
+			# Attach the lower ranked root below the higher ranked one (ties broken by index), this order rules out cycles
+			swap = (self.rank[root_u] > self.rank[root_v]) | ((self.rank[root_u] == self.rank[root_v]) & (root_u > root_v))
+			low = np.where(swap, root_v, root_u)
+			high = np.where(swap, root_u, root_v)
 
+			# A root can only be attached once per round, pairs that lost are retried in the next round
+			self.parent[low] = high
+			attached = self.parent[low] == high
+			np.maximum.at(self.rank, high[attached], self.rank[low[attached]] + 1)
+
+	'''
+	Returns the root index of every item
+	'''
+	def roots(self):
+		return self.root_indices(np.arange(len(self.items)))
+
+	'''
+	Returns the members of every set, sets and members are ordered by first appearance in init_arr
+	'''
+	def get(self):
+		roots = self.roots()
+		neighborhoods = {}
+		for index, root in enumerate(roots.tolist()):
+			neighborhoods.setdefault(root, []).append(self.items[index])
+		return list(neighborhoods.values())
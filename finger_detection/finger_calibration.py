@@ -15,28 +15,76 @@ from methods import normalize
 from pyglui.cygl.utils import draw_points_norm, draw_polyline, RGBA, draw_rounded_rect
 from OpenGL.GL import GL_POLYGON
 from .. finish_calibration import finish_calibration
-from . finger_detection import Finger_Detection
+from . finger_detection import Finger_Tracker
+from . color_segmentation import Color_Segmentation, Adaptive_Color_Segmentation
+from . detection_worker import Detection_Worker
+from . detection_scheduler import Detection_Scheduler
+from . frame_buffers import Frame_Buffers
+from . fingertip_tracker import Fingertip_Tracker
+from . incremental_calibration import Incremental_Calibration, MAX_DISPERSION
+from . profiler import profiler, STAGES
+from . sample_recorder import Sample_Recorder, PUPIL_DTYPE, REFERENCE_DTYPE, FINGER_DTYPE, GAZE_DTYPE, pupil_record, reference_record, gaze_record, pupil_dicts, reference_dicts
+from . accuracy_analysis import analyze, save_session, save_results
 from glfw import GLFW_PRESS
 from pyglui import ui
 from .. calibration_plugin_base import Calibration_Plugin
 
 logger = logging.getLogger(__name__)
 
+MAX_MARKER_SPEED = 0.3 # Normalized units per second up to which a fingertip counts as steady (0.01 per frame at 30 fps)
+CONTOUR_TOLERANCE = 1 / 640. # Distance (share of the frame width) up to which the drawn contour may deviate, a pixel of a 640 pixel wide preview
+
+'''
+Returns the points (pixels) normalized to the given frame size with the origin at the bottom left (like normalize with flip_y), as contiguous float array
+'''
+def normalize_points(points, frame_size):
+    points = np.array(points, dtype=np.float32).reshape(-1, 2) / np.array(frame_size, dtype=np.float32)
+    points[:, 1] = 1 - points[:, 1]
+    return points
+
+'''
+Returns the contour simplified within the given tolerance (pixels) as closed polyline (contiguous float array), or None for less than 3 points
+'''
+def contour_polyline(contour, tolerance):
+    if len(contour) < 3:
+        return None
+    points = cv2.approxPolyDP(contour, tolerance, True).reshape(-1, 2)
+    return np.ascontiguousarray(np.concatenate([points, points[:1]]), dtype=np.float32)
+
 class Finger_Calibration(Calibration_Plugin):
 
     def __init__(self, g_pool):
         super().__init__(g_pool)
         self.detected = False
         self.pos = None
-        self.smooth_pos = 0.,0.
-        self.smooth_vel = 0.
+        self.marker = None
+        self.marker_speed = 0.
         self.sample_site = (-2,-2)
+        self.sample_site_index = -1
         self.counter = 0
         self.counter_max = 30
         self.markers = []
+        self.fingers = []
         self.show_contour = True
         self.contour = []
+        # Contour and fingertips as drawn by gl_display, prepared once per detection
+        self.contour_points = None
+        self.marker_points = np.empty((0, 2), dtype=np.float32)
+        self.marker_point = None
         self.world_size = None
+        # Images of the detection steps, sized for the world camera (separate ones for the background worker)
+        self.buffers = Frame_Buffers()
+        self.worker_buffers = Frame_Buffers()
+        self.finger_tracker = Finger_Tracker(buffers=self.buffers)
+        self.fingertip_tracker = Fingertip_Tracker()
+        self.detection_worker = Detection_Worker(self.worker_buffers)
+        self.async_detection = False
+        self.detection_scheduler = Detection_Scheduler()
+        self.skip_static_frames = True
+        self.pyramid_detection = False
+        self.adaptive_color = False
+        self.incremental_calibration = Incremental_Calibration()
+        self.incremental = True
 
         self.static_finger = True
         self.correct_finger_scale = 25
@@ -52,7 +100,11 @@ class Finger_Calibration(Calibration_Plugin):
         self.can_click_for_color = False
 
         self.finger_log_enabled = False
-        self.finger_log = []
+        self.finger_log = None
+        self.pupil_recorder = None
+        self.ref_recorder = None
+        self.accuracy_log_enabled = False
+        self.gaze_recorder = None
         self.first_sample = True
         self.start_time = 0
         self.end_time = 0
@@ -67,7 +119,13 @@ class Finger_Calibration(Calibration_Plugin):
         self.menu.append(ui.Switch('static_finger',self,label='Use static fingers'))
         self.menu.append(ui.Slider('correct_finger_scale',self,step=1, min=0, max=60, label='Finger correction scale'))
         self.menu.append(ui.Switch('show_contour',self,label='Show contour lines'))
+        self.menu.append(ui.Switch('async_detection',self,label='Detect fingers in background'))
+        self.menu.append(ui.Switch('skip_static_frames',self,label='Skip detection of unmoved static fingers'))
+        self.menu.append(ui.Switch('pyramid_detection',self,label='Detect hand at lower resolution'))
         self.menu.append(ui.Switch('finger_log_enabled',self,label='Log finger calibration points'))
+        self.menu.append(ui.Switch('accuracy_log_enabled',self,label='Store accuracy test results'))
+        self.menu.append(ui.Switch('incremental',self,label='Match samples while sampling'))
+        self.menu.append(ui.Text_Input('prediction_error',self,label='Prediction error',getter=lambda: self.incremental_calibration.summary(self.world_size),setter=lambda _: None))
 
         self.menu.append(ui.Info_Text("Choose HSV color threshold for hand segmentation:"))
         self.menu.append(ui.Button('Click to choose color', self.show_click_infotext))
@@ -78,18 +136,33 @@ class Finger_Calibration(Calibration_Plugin):
 
         self.menu.append(ui.Button('Set to default handskin', self.set_to_handskin_color))
         self.menu.append(ui.Button('Set to default red glove', self.set_to_glove_color))
+        self.menu.append(ui.Switch('adaptive_color',self,label='Adapt color to the hand',setter=self.set_adaptive_color))
 
         self.menu.append(ui.Info_Text("Set tolerance range for individual color channels:"))
         self.menu.append(ui.Slider('color_tolerance_h',self,step=1, min=0, max=35, label='Range Hue'))
         self.menu.append(ui.Slider('color_tolerance_s',self,step=1, min=0, max=100, label='Range Saturation'))
         self.menu.append(ui.Slider('color_tolerance_v',self,step=1, min=0, max=100, label='Range Value'))
 
+        profiling_menu = ui.Growing_Menu('Detection profiling')
+        profiling_menu.collapsed = True
+        profiling_menu.append(ui.Info_Text("Time (in ms) spent in each detection stage over the last frames as 50th / 95th / 99th percentile. Stored as CSV file when stopping."))
+        profiling_menu.append(ui.Switch('enabled',profiler,label='Profile detection stages'))
+        for stage in STAGES:
+            profiling_menu.append(ui.Text_Input(stage,profiler,label=stage,getter=lambda stage=stage: profiler.summary(stage),setter=lambda _: None))
+        self.menu.append(profiling_menu)
+
     def start(self):
         super().start()
         audio.say("Starting {}".format(self.mode_pretty))
         logger.info("Starting {}".format(self.mode_pretty))
 
-        self.finger_log = []
+        # Samples are streamed to temporary files while the calibration runs
+        self.close_recorders()
+        self.finger_log = Sample_Recorder(FINGER_DTYPE, directory=self.g_pool.user_dir)
+        self.pupil_recorder = Sample_Recorder(PUPIL_DTYPE, directory=self.g_pool.user_dir)
+        self.ref_recorder = Sample_Recorder(REFERENCE_DTYPE, directory=self.g_pool.user_dir)
+        self.gaze_recorder = Sample_Recorder(GAZE_DTYPE, directory=self.g_pool.user_dir)
+        self.sample_site_index = -1
         self.start_time = 0
         self.end_time = 0
         self.first_sample = True
@@ -97,9 +170,14 @@ class Finger_Calibration(Calibration_Plugin):
         self.clicked_color_point = None
         self.can_click_for_color = False
 
+        self.finger_tracker.reset()
+        self.fingertip_tracker.reset()
+        self.detection_scheduler.reset()
+        self.incremental_calibration.reset()
+        self.detection_worker.reset()
+        profiler.reset()
+
         self.active = True
-        self.ref_list = []
-        self.pupil_list = []
 
     def stop(self):
         audio.say("Stopping  {}".format(self.mode_pretty))
@@ -107,24 +185,71 @@ class Finger_Calibration(Calibration_Plugin):
         self.screen_marker_state = 0
         self.active = False
         self.button.status_text = ''
+        self.detection_worker.stop()
 
         logger.info("Calibration took {} seconds.".format(self.end_time - self.start_time))
 
+        # Store timings of the detection stages to a file
+        if profiler.enabled:
+            profiler.save('finger_detection_profile_'+time.strftime('%Y-%m-%d_%H:%M:%S', time.gmtime())+'.csv')
+
+        # Store logged finger positions (timestamp and fingertip in pixels) to a file
+        if self.finger_log_enabled:
+            prefix = 'finger_calibration_points_' if self.mode == 'calibration' else 'finger_accuracy_test_points_'
+            finger_log = self.finger_log.read()
+            np.savetxt(prefix+time.strftime('%Y-%m-%d_%H:%M:%S', time.gmtime())+'.txt', np.column_stack([finger_log['timestamp'], finger_log['tip']]),
+                       fmt=['%.6f', '%d', '%d'], header='timestamp x y')
+
+        # Pupil's calibration expects lists of dicts, they are only built from the recorded samples once
+        # With incremental matching, only the pupil data which belongs to the references is passed on to the calibration,
+        # otherwise the pupil data which is close enough in time to the first and last reference to be matched
+        # The accuracy test gets all pupil data, Pupil maps it with the active gaze mapper (binocular pairing, precision of successive samples)
+        refs = self.ref_recorder.read()
+        if self.mode == 'calibration' and self.incremental:
+            self.incremental_calibration.update(self.pupil_recorder.read(), refs, final=True)
+            pupil_list = pupil_dicts(self.incremental_calibration.pupil_samples(self.pupil_recorder.read()))
+        elif self.mode == 'calibration' and len(refs) > 0:
+            pupil_list = pupil_dicts(self.pupil_recorder.window(refs['timestamp'][0] - MAX_DISPERSION, refs['timestamp'][-1] + MAX_DISPERSION))
+        else:
+            pupil_list = pupil_dicts(self.pupil_recorder.read())
+        ref_list = reference_dicts(refs)
+        if self.mode == 'accuracy_test':
+            self.analyze_accuracy_test(refs, self.gaze_recorder.read())
+        self.close_recorders()
+
         if self.mode == 'calibration':
-            # Store array of logged finger positions to a file
-            if self.finger_log_enabled:
-                file = open('finger_calibration_points_'+time.strftime('%Y-%m-%d_%H:%M:%S', time.gmtime())+'.txt', 'w')
-                file.write('\n'.join(str(e[0]) for e in self.finger_log))
-                file.close()
-            finish_calibration(self.g_pool, self.pupil_list, self.ref_list)
+            finish_calibration(self.g_pool, pupil_list, ref_list)
         elif self.mode == 'accuracy_test':
-            if self.finger_log_enabled:
-                file = open('finger_accuracy_test_points_'+time.strftime('%Y-%m-%d_%H:%M:%S', time.gmtime())+'.txt', 'w')
-                file.write('\n'.join(str(e[0]) for e in self.finger_log))
-                file.close()
-            self.finish_accuracy_test(self.pupil_list, self.ref_list)
+            self.finish_accuracy_test(pupil_list, ref_list)
         super().stop()
 
+    def close_recorders(self):
+        for recorder in (self.finger_log, self.pupil_recorder, self.ref_recorder, self.gaze_recorder):
+            if recorder is not None:
+                recorder.close()
+        self.finger_log = None
+        self.pupil_recorder = None
+        self.ref_recorder = None
+        self.gaze_recorder = None
+
+    def analyze_accuracy_test(self, refs, gaze):
+        """
+        logs accuracy and precision (degrees) of the gaze recorded during the accuracy test
+        if enabled, the references and gaze are stored for accuracy_analysis together with the results per sample site
+        """
+        if len(refs) == 0 or len(gaze) == 0 or self.world_size is None:
+            return
+        intrinsics = getattr(self.g_pool.capture, 'intrinsics', None)
+        camera_matrix, dist_coefs = (intrinsics.K, intrinsics.D) if intrinsics is not None else (None, None)
+        sites, session, _ = analyze(refs, gaze, self.world_size, camera_matrix, dist_coefs)
+        logger.info("Accuracy test: accuracy {:.2f} degrees, precision {:.2f} degrees over {} sample sites ({} of {} samples used)".format(
+            session['accuracy'], session['precision'], len(sites), session['inliers'], session['samples']))
+
+        if self.accuracy_log_enabled:
+            name = 'finger_accuracy_test_'+time.strftime('%Y-%m-%d_%H:%M:%S', time.gmtime())
+            save_session(name+'.npz', refs, gaze, self.world_size, camera_matrix, dist_coefs)
+            save_results(name+'.csv', [(name, sites, session)])
+
     def show_click_infotext(self):
         logger.debug("Click on the scene camera preview window to extract the corresponding pixel color.")
         self.can_click_for_color = True
@@ -151,11 +276,20 @@ class Finger_Calibration(Calibration_Plugin):
         self.color_tolerance_s = 40
         self.color_tolerance_v = 40
 
+    def set_adaptive_color(self, adaptive_color):
+        '''
+        Switches between the fixed color threshold and the color model which is learned from the detected hands (seeded by the threshold)
+        '''
+        self.adaptive_color = adaptive_color
+        for tracker in (self.finger_tracker, self.detection_worker.tracker):
+            tracker.segmentation = Adaptive_Color_Segmentation() if adaptive_color else Color_Segmentation()
+
     def on_notify(self, notification):
         '''
         Reacts to notifications:
            ``calibration.should_start``: Starts the calibration procedure
            ``calibration.should_stop``: Stops the calibration procedure
+           ``calibration.marker_sample_completed``, ``calibration.marker_moved_too_quickly``: Matches the new samples (if incremental)
 
         Emits notifications:
             ``calibration.started``: Calibration procedure started
@@ -167,6 +301,10 @@ class Finger_Calibration(Calibration_Plugin):
         '''
         super().on_notify(notification)
 
+        if self.active and self.incremental and notification['subject'] in ('calibration.marker_sample_completed', 'calibration.marker_moved_too_quickly'):
+            self.incremental_calibration.update(self.pupil_recorder.read(), self.ref_recorder.read())
+            logger.debug("Prediction error: {}".format(self.incremental_calibration.summary(self.world_size)))
+
     def recent_events(self, events):
         """
         gets called once every frame.
@@ -177,12 +315,15 @@ class Finger_Calibration(Calibration_Plugin):
 
         if frame:
             self.world_size = frame.width,frame.height
+            # The buffers are only rebuilt when the camera resolution changes
+            self.buffers.set_resolution(self.world_size)
+            self.worker_buffers.set_resolution(self.world_size)
             
             # Check if user selected a new color as threshold
             if self.clicked_color_point is not None:
-                pnt = [int(self.clicked_color_point[0][0]), int(self.clicked_color_point[0][1])]
+                pnt = [min(max(int(self.clicked_color_point[0][0]), 0), frame.width - 1), min(max(int(self.clicked_color_point[0][1]), 0), frame.height - 1)]
 
-                bgr_color = frame.img[pnt[1]][pnt[0]];
+                bgr_color = frame.img[pnt[1], pnt[0]]
                 extracted_color = colorsys.rgb_to_hsv(bgr_color[2]/255, bgr_color[1]/255, bgr_color[0]/255)
                 self.color_h = int(extracted_color[0]*360)
                 self.color_s = int(extracted_color[1]*100)
@@ -192,91 +333,48 @@ class Finger_Calibration(Calibration_Plugin):
 
         if self.active and frame:
             recent_pupil_positions = events['pupil_positions']
+            # The image may be decoded on access, it is read once and handed to the detection without copies
+            img = frame.img
 
             # Normalize HSV color specs to OpenCV HSV color specs
-            color_threshold = [self.color_h/2, self.color_s * 2.55, self.color_v * 2.55, self.color_tolerance_h/2, self.color_tolerance_s * 2.55, self.color_tolerance_v * 2.55]
+            color_threshold = Color_Segmentation.normalizeThreshold(self.color_h, self.color_s, self.color_v, self.color_tolerance_h, self.color_tolerance_s, self.color_tolerance_v)
 
             # Detect fingertips
-            res = Finger_Detection.findFingers(frame.img, 30, color_threshold, self.correct_finger_scale)
-            fingers = res[0]
-            self.contour = res[1]
-
-            # Only update finger positions if we aren't currently collecting data points (if static fingers enabled)
-            if self.counter <= 0 or not self.static_finger:
-                self.markers = fingers
-
-            # Detected single fingertip
-            if len(self.markers) == 1:
-                self.detected = True
-                marker_pos = [float(self.markers[0][0]), float(self.markers[0][1])]
-
-                self.pos = normalize(marker_pos, (frame.width,frame.height),flip_y=True)
+            self.finger_tracker.pyramid = self.detection_worker.tracker.pyramid = self.pyramid_detection
+            if self.async_detection:
+                # Hand the frame to the background worker and continue with the newest finished detection (if any)
+                self.detection_worker.submit(img, frame.timestamp, 30, color_threshold, self.correct_finger_scale)
+                res = self.detection_worker.poll()
+            elif self.skip_static_frames and not self.detection_scheduler.should_detect(img, self.marker, self.counter > 0 and self.static_finger):
+                # The static finger hasn't moved, the fingertips of the last detection are used again
+                res = (self.fingers, self.contour, frame.timestamp)
             else:
-                self.detected = False
-                self.pos = None  # indicate that no reference is detected
-            
-            # Tracking logic
-            # Code copied from Pupil's manual marker plugin implementation
-            if self.detected:
-                # calculate smoothed manhattan velocity
-                smoother = 0.3
-                smooth_pos = np.array(self.smooth_pos)
-                pos = np.array(self.pos)
-                new_smooth_pos = smooth_pos + smoother*(pos-smooth_pos)
-                smooth_vel_vec = new_smooth_pos - smooth_pos
-                smooth_pos = new_smooth_pos
-                self.smooth_pos = list(smooth_pos)
-                #manhattan distance for velocity
-                new_vel = abs(smooth_vel_vec[0])+abs(smooth_vel_vec[1])
-                self.smooth_vel = self.smooth_vel + smoother*(new_vel-self.smooth_vel)
-
-                #distance to last sampled site
-                sample_ref_dist = smooth_pos-np.array(self.sample_site)
-                sample_ref_dist = abs(sample_ref_dist[0])+abs(sample_ref_dist[1])
-
-                # start counter if ref is resting in place and not at last sample site
-                if self.counter <= 0:
-                    if self.smooth_vel < 0.01 and sample_ref_dist > 0.1:
-                        self.sample_site = self.smooth_pos
-                        audio.beep()
-                        self.end_time = time.time()
-                        if self.first_sample:
-                            self.first_sample = False
-                            self.start_time = time.time()
-
-                        logger.debug("Steady marker found. Starting to sample {} datapoints".format(self.counter_max))
-                        self.notify_all({'subject':'calibration.marker_found','timestamp':self.g_pool.get_timestamp(),'record':True})
-                        self.counter = self.counter_max
-                        self.finger_log.append(self.markers)
-
-                if self.counter > 0:
-                    if self.smooth_vel > 0.01:
-                        audio.tink()
-                        self.end_time = time.time()
-                        logger.warning("Marker moved too quickly: Sampled {} datapoints. Looking for steady marker again.".format(self.counter_max-self.counter))
-                        self.notify_all({'subject':'calibration.marker_moved_too_quickly','timestamp':self.g_pool.get_timestamp(),'record':True})
-                        self.counter = 0
-                    else:
-                        self.counter -= 1
-                        ref = {}
-                        ref["norm_pos"] = self.pos
-                        ref["screen_pos"] = marker_pos
-                        ref["timestamp"] = frame.timestamp
-                        self.ref_list.append(ref)
-
-                        if events.get('fixations', []):
-                            self.counter -= 5
-                        if self.counter <= 0:
-                            #last sample before counter done and moving on
-                            audio.tink()
-                            self.end_time = time.time()
-                            logger.info("Sampled {} datapoints. Stopping to sample. Looking for steady marker again.".format(self.counter_max))
-                            self.notify_all({'subject':'calibration.marker_sample_completed','timestamp':self.g_pool.get_timestamp(),'record':True})
+                # Move the search region along with the predicted calibration fingertip
+                motion = None
+                if self.marker is not None:
+                    predicted = self.fingertip_tracker.predict(frame.timestamp)
+                    if predicted is not None:
+                        motion = predicted - self.fingertip_tracker.primary.position
+                res = self.finger_tracker.findFingers(img, 30, color_threshold, self.correct_finger_scale, motion, frame.timestamp) + (frame.timestamp,)
+
+            if res is not None:
+                fingers, contour, timestamp = res
+                if contour is not self.contour:
+                    self.contour_points = contour_polyline(contour, CONTOUR_TOLERANCE * frame.width)
+                self.fingers, self.contour = fingers, contour
+                self.update_markers(fingers, timestamp, (frame.width, frame.height), events)
+                self.marker_points = normalize_points(self.markers, (frame.width, frame.height))
+                self.marker_point = None if self.marker is None else normalize_points([self.marker], (frame.width, frame.height))
 
             #always save pupil positions
             for p_pt in recent_pupil_positions:
                 if p_pt['confidence'] > self.pupil_confidence_threshold:
-                    self.pupil_list.append(p_pt)
+                    self.pupil_recorder.append(pupil_record(p_pt))
+
+            # Gaze of the current calibration is compared to the references after the accuracy test
+            if self.mode == 'accuracy_test':
+                for g_pt in events.get('gaze_positions', []):
+                    self.gaze_recorder.append(gaze_record(g_pt))
 
             if self.counter <= 0:
                 self.button.status_text = 'Looking for Marker'
@@ -286,6 +384,81 @@ class Finger_Calibration(Calibration_Plugin):
             pass
 
 
+    def update_markers(self, fingers, timestamp, frame_size, events):
+        """
+        runs the sampling logic on the fingertips detected in the frame with the given timestamp
+        """
+        # Associate the fingertips with the tracked ones, the calibration fingertip keeps its track when other tips appear
+        track = self.fingertip_tracker.update(fingers, timestamp)
+
+        # Only update finger positions if we aren't currently collecting data points (if static fingers enabled)
+        if self.counter <= 0 or not self.static_finger:
+            self.markers = fingers
+            self.marker = None if track is None else [float(track.position[0]), float(track.position[1])]
+            # Manhattan velocity (normalized units per second) of the filtered fingertip
+            self.marker_speed = 0. if track is None else abs(track.velocity[0]) / frame_size[0] + abs(track.velocity[1]) / frame_size[1]
+        else:
+            # Static finger while sampling: the marker stays at the sample site
+            self.marker_speed = 0.
+
+        if self.marker is not None:
+            self.detected = True
+            marker_pos = self.marker
+
+            self.pos = normalize(marker_pos, frame_size,flip_y=True)
+        else:
+            self.detected = False
+            self.pos = None  # indicate that no reference is detected
+
+        # Tracking logic
+        # Sampling state machine of Pupil's manual marker plugin, velocities come from the fingertip tracker
+        if self.detected:
+            #distance to last sampled site
+            sample_ref_dist = np.array(self.pos)-np.array(self.sample_site)
+            sample_ref_dist = abs(sample_ref_dist[0])+abs(sample_ref_dist[1])
+
+            # start counter if ref is resting in place and not at last sample site
+            if self.counter <= 0:
+                if self.marker_speed < MAX_MARKER_SPEED and sample_ref_dist > 0.1:
+                    self.sample_site = self.pos
+                    self.sample_site_index += 1
+                    audio.beep()
+                    self.end_time = time.time()
+                    if self.first_sample:
+                        self.first_sample = False
+                        self.start_time = time.time()
+
+                    logger.debug("Steady marker found. Starting to sample {} datapoints".format(self.counter_max))
+                    self.notify_all({'subject':'calibration.marker_found','timestamp':self.g_pool.get_timestamp(),'record':True})
+                    self.counter = self.counter_max
+                    self.finger_log.append((timestamp, marker_pos))
+
+            if self.counter > 0:
+                if self.marker_speed > MAX_MARKER_SPEED:
+                    audio.tink()
+                    self.end_time = time.time()
+                    logger.warning("Marker moved too quickly: Sampled {} datapoints. Looking for steady marker again.".format(self.counter_max-self.counter))
+                    self.notify_all({'subject':'calibration.marker_moved_too_quickly','timestamp':self.g_pool.get_timestamp(),'record':True})
+                    self.counter = 0
+                else:
+                    self.counter -= 1
+                    ref = {}
+                    ref["norm_pos"] = self.pos
+                    ref["screen_pos"] = marker_pos
+                    ref["timestamp"] = timestamp
+                    ref["site"] = self.sample_site_index
+                    self.ref_recorder.append(reference_record(ref))
+
+                    if events.get('fixations', []):
+                        self.counter -= 5
+                    if self.counter <= 0:
+                        #last sample before counter done and moving on
+                        audio.tink()
+                        self.end_time = time.time()
+                        logger.info("Sampled {} datapoints. Stopping to sample. Looking for steady marker again.".format(self.counter_max))
+                        self.notify_all({'subject':'calibration.marker_sample_completed','timestamp':self.g_pool.get_timestamp(),'record':True})
+
+
     def gl_display(self):
         """
         use gl calls to render
@@ -311,21 +484,15 @@ class Finger_Calibration(Calibration_Plugin):
 
         if self.active:
 
-            # Draw contour of hand
-            if self.show_contour:
-                con = [(c[0][0], c[0][1]) for c in self.contour]
-                if len(con) > 2:
-                    con.append(con[0])
-                    draw_polyline(con, color=RGBA(0.,1.,0.,.7), thickness=5.0)
-
-            # Draw all detected fingertips
-            if len(self.markers) == 1:
-                marker_norm = normalize(self.markers[0], (self.world_size[0],self.world_size[1]), flip_y=True)
-                draw_points_norm([marker_norm], size=30, color=RGBA(0.,1.,1.,.5))
-            else:
-                for mark in self.markers:
-                    marker_norm = normalize(mark, (self.world_size[0],self.world_size[1]), flip_y=True)
-                    draw_points_norm([marker_norm], size=30, color=RGBA(0.,0.,1.,.5))
+            # Draw contour of hand (simplified and closed after the detection)
+            if self.show_contour and self.contour_points is not None:
+                draw_polyline(self.contour_points, color=RGBA(0.,1.,0.,.7), thickness=5.0)
+
+            # Draw all detected fingertips with one call, the tracked calibration fingertip is highlighted
+            if len(self.marker_points) > 0:
+                draw_points_norm(self.marker_points, size=30, color=RGBA(0.,0.,1.,.5))
+            if self.marker_point is not None:
+                draw_points_norm(self.marker_point, size=30, color=RGBA(0.,1.,1.,.5))
 
 
     def on_click(self, pos, button, action):
@@ -342,4 +509,5 @@ class Finger_Calibration(Calibration_Plugin):
         """
         if self.active:
             self.stop()
+        self.close_recorders()
         super().deinit_ui()
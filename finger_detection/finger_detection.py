@@ -8,15 +8,35 @@ import cv2
 import numpy as np
 import copy
 import math
+import threading
 import time
+import concurrent.futures
 
 from . disjoint_set import DisjointSet
+from . color_segmentation import Color_Segmentation
+from . frame_buffers import Frame_Buffers
+from . profiler import profiler
 
 # parameters
 BLUR_VALUE = 7
 NEIGHBORHOOD_SIZE = 50
 LOWER_CUT_PERCENTAGE = 0.3 # Doesn't consider the 30% lowest parts of the contour as fingertips (results in less false positives)
 DILATION_SIZE = 5
+DILATION_KERNEL = np.ones((DILATION_SIZE, DILATION_SIZE), np.uint8)
+TRACKING_MARGIN = 80 # Margin (in pixels) around the last detected hand in which the hand is searched in the next frame
+MIN_HAND_AREA = 0.01 # Minimal area of a hand relative to the area of the camera frame
+MAX_HAND_ASPECT = 6 # Maximal ratio between the longer and the shorter side of the bounding box of a hand
+MIN_HAND_SOLIDITY = 0.3 # Hands fill at least this fraction of their convex hull
+MAX_FINGER_SOLIDITY = 0.95 # Hands which fill more of their convex hull have no stretched fingers
+MAX_HAND_CANDIDATES = 3 # Number of the biggest contours which are checked for being a hand
+REFERENCE_HEIGHT = 1080 # Frame height at which the pixel constants above give the best results (scaled to other heights in the pyramid mode)
+PYRAMID_HEIGHT = 360 # Frame height at which the pyramid mode searches the hand
+REFINE_RADIUS = 4 # Radius (in pixels of the downscaled frame) of the neighborhood in which the pyramid mode refines the fingertips
+
+# Results of findFingersBatch: all fingertips of the batch (with their frame index) and one hand record per frame
+# The tips of frame i are tips[hands['tip_offset'][i]:hands['tip_offset'][i] + hands['tip_count'][i]]
+TIP_DTYPE = np.dtype([('frame', 'i4'), ('position', 'i4', 2)])
+HAND_DTYPE = np.dtype([('found', '?'), ('area', 'f8'), ('bounding_rect', 'i4', 4), ('contour_points', 'i4'), ('tip_offset', 'i8'), ('tip_count', 'i4')])
 
 class Finger_Detection():
 
@@ -29,212 +49,499 @@ class Finger_Detection():
     '''
     Extract foreground from background by thresholding the color
     Colors need to be normalized to OpenCVs HSV norm (e.g., h is between 0 and 180)
+    Pass a Color_Segmentation to reuse its cached threshold and Frame_Buffers to reuse the images across frames
+    The masked color frame is only built if masked_frame is set (e.g. for displaying it), otherwise None is returned instead
     '''
-    def removeBG(frame, segmentation_color):
-        # change the color space
-        hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-        h = segmentation_color[0]
-        s = segmentation_color[1]
-        v = segmentation_color[2]
-        tolerance_h = segmentation_color[3]
-        tolerance_s = segmentation_color[4]
-        tolerance_v = segmentation_color[5]
-
-        # define range for hand color in HSV
-        mask = 0
-
-        if h >= tolerance_h and (h+tolerance_h) <= 180:
-            # E.g. h=50 and tolerance_h=10 -> valid range is [40, 60]
-            mask = cv2.inRange(hsv, np.array([h - tolerance_h, s - tolerance_s, v - tolerance_v]), np.array([h + tolerance_h, s + tolerance_s, v + tolerance_v]))
-        elif h < tolerance_h:
-            # E.g. h=10 and tolerance_h=20 -> valid range is [350, 360] and [0,30]
-            mask_temp1 = cv2.inRange(hsv, np.array([0, s - tolerance_s, v - tolerance_v]), np.array([h + tolerance_h, s + tolerance_s, v + tolerance_v]))
-            mask_temp2 = cv2.inRange(hsv, np.array([180 - (tolerance_h - h), s - tolerance_s, v - tolerance_v]), np.array([180, s + tolerance_s, v + tolerance_v]))
-            mask = cv2.addWeighted(mask_temp1, 1.0, mask_temp2, 1.0, 0.0)
-        else:
-            # E.g. h=350 and tolerance_h=20 -> valid range is [330, 360] and [0,10]
-            mask_temp1 = cv2.inRange(hsv, np.array([h - tolerance_h, s - tolerance_s, v - tolerance_v]), np.array([180, s + tolerance_s, v + tolerance_v]))
-            mask_temp2 = cv2.inRange(hsv, np.array([0, s - tolerance_s, v - tolerance_v]), np.array([0 + (h+tolerance_h-180), s + tolerance_s, v + tolerance_v]))
-            mask = cv2.addWeighted(mask_temp1, 1.0, mask_temp2, 1.0, 0.0)
-
-        # Remove noise in mask
-        mask = cv2.medianBlur(mask, DILATION_SIZE)
-        mask = cv2.dilate(mask, np.ones((DILATION_SIZE, DILATION_SIZE), np.uint8))
-
-        result = cv2.bitwise_and(frame, frame, mask=mask)
+    def removeBG(frame, segmentation_color, segmentation=None, buffers=None, masked_frame=True, dilation_size=DILATION_SIZE):
+        if segmentation is None:
+            segmentation = Color_Segmentation()
+        if buffers is None:
+            buffers = Frame_Buffers()
+
+        # threshold hand color in HSV
+        mask = segmentation.getMask(frame, segmentation_color, buffers)
+        mask = Finger_Detection.cleanMask(mask, buffers, dilation_size)
+
+        result = None
+        if masked_frame:
+            result = cv2.bitwise_and(frame, frame, mask=mask)
         return tuple([result, mask])
 
+    '''
+    Remove noise in mask
+    '''
+    def cleanMask(mask, buffers, dilation_size=DILATION_SIZE):
+        kernel = DILATION_KERNEL if dilation_size == DILATION_SIZE else np.ones((dilation_size, dilation_size), np.uint8)
+        # The median filter needs a size of at least 3, a dilation of size 1 doesn't change the mask
+        mask = cv2.medianBlur(mask, max(dilation_size, 3), dst=buffers.get('median', mask.shape))
+        if dilation_size == 1:
+            return mask
+        return cv2.dilate(mask, kernel, dst=buffers.get('dilated', mask.shape))
+
     '''
     Group hull points (which are in the same region) together
+    Neighborhoods are the connected components of all hull points within maxDist of each other,
+    each neighborhood is represented by the hull point closest to its center
+    Pass the hull (indices as returned by cv2.convexHull) if it is already known
     '''
-    def getHullPoints(res, maxDist):
-        hull = cv2.convexHull(res, returnPoints=False)   
+    def getHullPoints(res, maxDist, hull=None):
+        if hull is None:
+            hull = cv2.convexHull(res, returnPoints=False)
+        indices = hull[:, 0]
+        pnts = res[indices, 0].astype(np.float64)
+        n = len(indices)
+        profiler.count('hull_points', n)
+
+        # Pairwise distances between all hull points
+        diff = pnts[:, None, :] - pnts[None, :, :]
+        adjacent = np.sqrt((diff ** 2).sum(axis=2)) <= maxDist
 
         # Group all points in local neighborhood
-        disj_set = DisjointSet(range(len(hull)))
-        for u in range(0, len(hull)):
-            for v in range(u+1, len(hull)):
-                pnt_u = res[hull[u][0]][0]
-                pnt_v = res[hull[v][0]][0]
-
-                if Finger_Detection.ptDist(pnt_u, pnt_v) <= maxDist:
-                    disj_set.union(u, v)
-
-        neighborhoods = disj_set.get()
-        points = []
+        disj_set = DisjointSet(range(n))
+        disj_set.union_pairs(*np.nonzero(np.triu(adjacent, 1)))
+        labels = disj_set.roots()
 
-        # Map points in local neighborhood to most central point
-        for i in range(len(neighborhoods)):
-            center = [0, 0]
-            
-            # Find center
-            for j in range(len(neighborhoods[i])):
-                pntIndex = neighborhoods[i][j]
-                pnt = res[hull[pntIndex][0]][0]
+        # Find center of each neighborhood
+        counts = np.bincount(labels, minlength=n)
+        center_x = np.bincount(labels, weights=pnts[:, 0], minlength=n)
+        center_y = np.bincount(labels, weights=pnts[:, 1], minlength=n)
+        center = np.stack([center_x, center_y], axis=1)[labels] / counts[labels, None]
+        center_dist = np.sqrt(((pnts - center) ** 2).sum(axis=1))
 
-                center[0] += pnt[0]
-                center[1] += pnt[1]
+        # Map points in local neighborhood to most central point (ties go to the later hull point)
+        order = np.lexsort((-np.arange(n), center_dist, labels))
+        first = np.ones(n, dtype=bool)
+        first[1:] = labels[order][1:] != labels[order][:-1]
+        closest = order[first]
 
-            center[0] = center[0]/len(neighborhoods[i])
-            center[1] = center[1]/len(neighborhoods[i])
+        profiler.count('hull_neighborhoods', len(closest))
 
-            closestPnt = [0, 0]
-            closestDst = math.inf
+        # Keep the points in hull order so that they remain a valid (monotonous) hull for cv2.convexityDefects
+        return indices[np.sort(closest)]
 
-            # Find point closest to center
-            for j in range(len(neighborhoods[i])):
-                pntIndex = neighborhoods[i][j]
-                pnt = res[hull[pntIndex][0]][0]
-
-                if Finger_Detection.ptDist(pnt, center) < closestDst:
-                    closestDst = Finger_Detection.ptDist(pnt, center)
-                    closestPnt = hull[pntIndex][0]
-
-            points.append(closestPnt)
-
-        return np.array(points)
+    '''
+    Calculate distances between the rows of two point arrays
+    '''
+    def ptDists(u, v):
+        return np.sqrt(((u - v) ** 2).sum(axis=1))
 
     '''
-    Returns vector which points in the same direction as the finger
+    Returns vectors which point in the same direction as the fingers (one for each row of pnt, d1, d2 and angle)
     '''
-    def getCorrectionVector(pnt, d1, d2, angle):
+    def getCorrectionVectors(pnt, d1, d2, angle):
         angle = angle * (math.pi / 180)
+        cos = np.cos(angle/2)
+        sin = np.sin(angle/2)
+        px, py = pnt[:, 0], pnt[:, 1]
 
         # Rotate d1 counterclockwise by angle/2 around pnt
-        qx = pnt[0] + math.cos(angle/2) * (d1[0] - pnt[0]) - math.sin(angle/2) * (d1[1] - pnt[1])
-        qy = pnt[1] + math.sin(angle/2) * (d1[0] - pnt[0]) + math.cos(angle/2) * (d1[1] - pnt[1])
-
-        q = [qx, qy]
-
-        if Finger_Detection.ptDist(d2, q) > Finger_Detection.ptDist(d2, d1):
-           # Rotated in wrong direction, rotate by taking the other point d2
-           qx = pnt[0] + math.cos(angle/2) * (d2[0] - pnt[0]) - math.sin(angle/2) * (d2[1] - pnt[1])
-           qy = pnt[1] + math.sin(angle/2) * (d2[0] - pnt[0]) + math.cos(angle/2) * (d2[1] - pnt[1])
+        qx = px + cos * (d1[:, 0] - px) - sin * (d1[:, 1] - py)
+        qy = py + sin * (d1[:, 0] - px) + cos * (d1[:, 1] - py)
 
-           q = [qx, qy]      
+        # Rotated in wrong direction, rotate by taking the other point d2
+        wrong = Finger_Detection.ptDists(d2, np.stack([qx, qy], axis=1)) > Finger_Detection.ptDists(d2, d1)
+        qx[wrong] = (px + cos * (d2[:, 0] - px) - sin * (d2[:, 1] - py))[wrong]
+        qy[wrong] = (py + sin * (d2[:, 0] - px) + cos * (d2[:, 1] - py))[wrong]
 
         # Get line equation of the rotated point and pnt
-        line = q - pnt
-        magnitude = np.sqrt(line.dot(line))
-        line = line/magnitude
-
-        return line
+        line = np.stack([qx - px, qy - py], axis=1)
+        magnitude = np.sqrt((line ** 2).sum(axis=1))
+        return line / magnitude[:, None]
 
     '''
-    Detects fingers in a given contour
+    Detects the fingertip hull points of a given contour
+    Returns the points and the unit vectors pointing from them into the fingers (both as arrays with one row per finger)
     '''
-    def detectFingers(res, finger_correction_scale):
-        hull = Finger_Detection.getHullPoints(res, NEIGHBORHOOD_SIZE)
-        fingerTips = []
+    def detectFingerPoints(res, neighborhood_size=NEIGHBORHOOD_SIZE, hull=None):
+        start = profiler.begin()
+        hull = Finger_Detection.getHullPoints(res, neighborhood_size, hull)
+        start = profiler.record('getHullPoints', start)
+        pnt = np.empty((0, 2), dtype=res.dtype)
+        line = np.empty((0, 2))
 
         defects = cv2.convexityDefects(res, hull)
+        start = profiler.record('convexityDefects', start)
 
         if type(defects) != type(None):
-
-            # Get neighboring defect points of each hull point
-            defectNeighbors = {}
-            for i in range(defects.shape[0]):
-                s, e, f, _ = defects[i][0]
-                
-                if s in defectNeighbors:
-                    defectNeighbors[s].append(f)
-                else:
-                    defectNeighbors[s] = [f]
-
-                if e in defectNeighbors:
-                    defectNeighbors[e].append(f)
-                else:
-                    defectNeighbors[e] = [f]
+            # OpenCV 3 returns the defects as (k, 1, 4), newer versions as (k, 4)
+            defects = defects.reshape(-1, 4)
+            profiler.count('defects', defects.shape[0])
+
+            # Get neighboring defect points of each hull point (each defect is a neighbor of its start and end point)
+            hull_indices = defects[:, :2].ravel()
+            defect_indices = np.repeat(defects[:, 2], 2)
+            order = np.argsort(hull_indices, kind='stable')
+            _, first, counts = np.unique(hull_indices[order], return_index=True, return_counts=True)
+
+            # Only consider hull points that have 2 neighbor defects (in order of their first appearance)
+            first = first[counts == 2]
+            first = first[np.argsort(order[first])]
+            candidates = res[hull_indices[order[first]], 0]
+            d1 = res[defect_indices[order[first]], 0]
+            d2 = res[defect_indices[order[first + 1]], 0]
 
             # Get point with highest and lowest y coordinate
             extTop = tuple(res[res[:, :, 1].argmin()][0])
             extBottom = tuple(res[res[:, :, 1].argmax()][0])
-            
+
             # Filter out any points which are in the lowest LOWER_CUT_PERCENTAGE %
             height = extTop[1] - extBottom[1]
             height_threshold = extBottom[1] + int(LOWER_CUT_PERCENTAGE * height)
 
-            for pntIndex, defecIndices in defectNeighbors.items():
+            a = Finger_Detection.ptDists(d1, d2)
+            b = Finger_Detection.ptDists(candidates, d1)
+            c = Finger_Detection.ptDists(candidates, d2)
 
-                # Only consider hull points that have 2 neighbor defects
-                if len(defecIndices) == 2:
-                    pnt = res[pntIndex][0]
-                    d1 = res[defecIndices[0]][0]
-                    d2 = res[defecIndices[1]][0]
+            # Fingertip points are those which have a sharp angle to its defect points
+            valid = (candidates[:, 1] <= height_threshold) & (b > 0) & (c > 0)
+            candidates, d1, d2, a, b, c = candidates[valid], d1[valid], d2[valid], a[valid], b[valid], c[valid]
+            term = (b ** 2 + c ** 2 - a ** 2) / (2 * b * c)
+            angle = np.arccos(np.clip(term, -1, 1)) * (180 / math.pi)
 
-                    a = Finger_Detection.ptDist(d1, d2)
-                    b = Finger_Detection.ptDist(pnt, d1)
-                    c = Finger_Detection.ptDist(pnt, d2)
+            # angle less than 60 degree, treat as fingers
+            fingers = angle <= 60
+            if fingers.any():
+                pnt = candidates[fingers]
+                line = Finger_Detection.getCorrectionVectors(pnt, d1[fingers], d2[fingers], angle[fingers])
 
-                    if pnt[1] > height_threshold:
-                        continue
-                    
-                    # Fingertip points are those which have a sharp angle to its defect points
-                    term = (b ** 2 + c ** 2 - a ** 2) / (2 * b * c)
-                    angle = math.acos(min(1, max(-1, term))) * (180 / math.pi)
+        profiler.record('fingertips', start)
+        return pnt, line
 
-                    # angle less than 60 degree, treat as fingers
-                    if angle <= 60:
-                        # Shift the point towards the inside of the finger
-                        line = Finger_Detection.getCorrectionVector(pnt, d1, d2, angle)    
-                        tip = pnt + [int(line[0]*finger_correction_scale), int(line[1]*finger_correction_scale)]
+    '''
+    Detects fingers in a given contour
+    '''
+    def detectFingers(res, finger_correction_scale, neighborhood_size=NEIGHBORHOOD_SIZE, hull=None):
+        pnt, line = Finger_Detection.detectFingerPoints(res, neighborhood_size, hull)
+        if len(pnt) == 0:
+            return []
 
-                        fingerTips.append([tip[0], tip[1]])
-        return fingerTips
+        # Shift the points towards the inside of the fingers
+        return (pnt + np.trunc(line * finger_correction_scale).astype(pnt.dtype)).tolist()
 
     '''
-    Returns the positions of finger tips in a given frame
+    Returns the contour of the hand and its convex hull (indices), or ([], None) if there is no hand
+    The hand is the biggest contour of the hand colored regions which passes cheap plausibility tests (area, bounding box, solidity)
+    The hull is None if the hand can't have stretched fingers (it fills almost all of its convex hull)
+    min_area is the minimal hand area in pixels (default: MIN_HAND_AREA of the frame)
     '''
-    def findFingers(frame, threshold, segmentation_color, finger_correction_scale):
-        res = Finger_Detection.removeBG(frame, segmentation_color)
-        img = res[0]
-        mask = res[1]
+    def findHand(frame, threshold, segmentation_color, segmentation=None, buffers=None, blur_size=BLUR_VALUE, dilation_size=DILATION_SIZE, min_area=None):
+        if segmentation is None:
+            segmentation = Color_Segmentation()
+        if buffers is None:
+            buffers = Frame_Buffers()
+        if min_area is None:
+            min_area = MIN_HAND_AREA * frame.shape[0] * frame.shape[1]
+
+        start = profiler.begin()
+        mask = segmentation.getMask(frame, segmentation_color, buffers)
+        return Finger_Detection.findHandInMask(mask, threshold, buffers, blur_size, dilation_size, min_area, start)
 
-        # Remove noise
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        blurred = cv2.GaussianBlur(gray, (BLUR_VALUE, BLUR_VALUE), 0)
-        _, thresholded = cv2.threshold(blurred, threshold, 255, cv2.THRESH_BINARY)
+    '''
+    Same as findHand for the color mask of a frame (see Color_Segmentation.getMask)
+    start is the profiler time at which the segmentation of the frame started
+    '''
+    def findHandInMask(mask, threshold, buffers=None, blur_size=BLUR_VALUE, dilation_size=DILATION_SIZE, min_area=None, start=None):
+        if buffers is None:
+            buffers = Frame_Buffers()
+        if min_area is None:
+            min_area = MIN_HAND_AREA * mask.shape[0] * mask.shape[1]
+        if start is None:
+            start = profiler.begin()
+
+        # Not enough hand colored pixels for a hand, skip all further steps
+        if cv2.countNonZero(mask) < min_area:
+            profiler.record('removeBG', start)
+            return ([], None)
+
+        mask = Finger_Detection.cleanMask(mask, buffers, dilation_size)
+        start = profiler.record('removeBG', start)
+
+        # Smooth the borders of the mask
+        blurred = cv2.GaussianBlur(mask, (blur_size, blur_size), 0, dst=buffers.get('blurred', mask.shape))
+        _, thresholded = cv2.threshold(blurred, threshold, 255, cv2.THRESH_BINARY, dst=buffers.get('thresholded', mask.shape))
+        start = profiler.record('threshold', start)
+
+        # get the coutours (OpenCV 3 returns image, contours and hierarchy, other versions only contours and hierarchy)
+        contours = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        start = profiler.record('findContours', start)
+
+        if len(contours) == 0:
+            return ([], None)
+
+        # Rank the contours by area and reject the ones which are too small or too elongated
+        areas = np.array([cv2.contourArea(contour) for contour in contours])
+        candidates = np.argsort(-areas, kind='stable')
+        candidates = candidates[areas[candidates] >= min_area][:MAX_HAND_CANDIDATES]
+        boxes = np.array([cv2.boundingRect(contours[i]) for i in candidates]).reshape(-1, 4)
+        aspect = np.maximum(boxes[:, 2], boxes[:, 3]) / np.maximum(np.minimum(boxes[:, 2], boxes[:, 3]), 1)
+        candidates = candidates[aspect <= MAX_HAND_ASPECT]
+
+        res = []
+        hull = None
+        for i in candidates:
+            # The hull is computed once and handed down to the fingertip detection
+            candidate_hull = cv2.convexHull(contours[i], returnPoints=False)
+            hull_area = cv2.contourArea(contours[i][candidate_hull[:, 0]])
+            solidity = areas[i] / hull_area if hull_area > 0 else 1.
+            if solidity >= MIN_HAND_SOLIDITY:
+                res = contours[i]
+                hull = candidate_hull if solidity <= MAX_FINGER_SOLIDITY else None
+                profiler.count('contour_points', len(res))
+                break
+
+        profiler.record('selectContour', start)
+        return (res, hull)
 
-        # get the coutours
-        _, contours, hierarchy = cv2.findContours(thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-        length = len(contours)
-        maxArea = -1
+    '''
+    Returns the positions of finger tips in a given frame
+    '''
+    def findFingers(frame, threshold, segmentation_color, finger_correction_scale, segmentation=None, buffers=None, min_area=None):
+        res, hull = Finger_Detection.findHand(frame, threshold, segmentation_color, segmentation, buffers, min_area=min_area)
 
         fingers = []
+        if hull is not None:
+            fingers = Finger_Detection.detectFingers(res, finger_correction_scale, hull=hull)
 
-        if length > 0:
-            # Find the biggest contour (according to area)
-            for i in range(length):  
-                temp = contours[i]
-                area = cv2.contourArea(temp)
-                if area > maxArea:
-                    maxArea = area
-                    ci = i
+        return (fingers, res)
 
-            res = contours[ci]
-            hull = cv2.convexHull(res)
+    '''
+    Returns the fingertips of a stack of frames (N, H, W, 3), e.g. an array or a memory-mapped chunk of a video (same results as findFingers per frame)
+    The color mask of the whole stack is computed in one segmentation pass (the stack is thresholded as one tall image),
+    the contour and fingertip steps run per frame on a pool of workers threads (OpenCV releases the GIL), one thread with workers set to 1
+    Returns the tips (TIP_DTYPE), one hand record per frame (HAND_DTYPE) and, with return_contours set, the list of hand contours
+    '''
+    def findFingersBatch(frames, threshold, segmentation_color, finger_correction_scale, segmentation=None, buffers=None, workers=None, min_area=None, return_contours=False):
+        if segmentation is None:
+            segmentation = Color_Segmentation()
+        count, height, width = frames.shape[:3]
+        if min_area is None:
+            min_area = MIN_HAND_AREA * height * width
+
+        stack = np.ascontiguousarray(frames).reshape(count * height, width, 3)
+        masks = segmentation.getMask(stack, segmentation_color, buffers).reshape(count, height, width)
+
+        # Every thread has its own buffers for the per frame steps
+        local = threading.local()
+        def detect(index):
+            if not hasattr(local, 'buffers'):
+                local.buffers = Frame_Buffers()
+            # One profiler row per frame, the segmentation of the whole stack isn't part of it
+            start = profiler.begin()
+            res, hull = Finger_Detection.findHandInMask(masks[index], threshold, local.buffers, min_area=min_area)
+            fingers = Finger_Detection.detectFingers(res, finger_correction_scale, hull=hull) if hull is not None else []
+            profiler.record('total', start)
+            profiler.endFrame()
+            return (fingers, res)
+
+        if workers == 1 or count <= 1:
+            results = [detect(index) for index in range(count)]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(detect, range(count)))
+
+        hands = np.zeros(count, dtype=HAND_DTYPE)
+        hands['tip_count'] = [len(fingers) for fingers, _ in results]
+        hands['tip_offset'][1:] = np.cumsum(hands['tip_count'])[:-1]
+        tips = np.zeros(int(hands['tip_count'].sum()), dtype=TIP_DTYPE)
+        tips['frame'] = np.repeat(np.arange(count), hands['tip_count'])
+        for index, (fingers, res) in enumerate(results):
+            if len(fingers) > 0:
+                tips['position'][hands['tip_offset'][index]:hands['tip_offset'][index] + len(fingers)] = fingers
+            if len(res) > 0:
+                hands[index] = (True, cv2.contourArea(res), cv2.boundingRect(res), len(res), hands['tip_offset'][index], len(fingers))
+
+        if return_contours:
+            return tips, hands, [res for _, res in results]
+        return tips, hands
+
+    '''
+    Returns the size of a pixel constant (tuned for REFERENCE_HEIGHT) for frames of the given height
+    Odd sizes stay odd (kernel sizes), sizes are at least minimum, with down set they are rounded down instead of to the nearest size
+    '''
+    def scaledSize(size, frame_height, odd=False, minimum=1, down=False):
+        size = size * frame_height / REFERENCE_HEIGHT
+        rounding = math.floor if down else round
+        size = int(rounding((size - 1) / 2)) * 2 + 1 if odd else int(rounding(size))
+        return max(size, minimum)
+
+    '''
+    Moves each fingertip point to the outermost hand pixel (along the finger) in a full resolution neighborhood
+    pnt are the points and line the finger directions as returned by detectFingerPoints (in full resolution coordinates)
+    The pixel constants are scaled to scale_height (height of the camera frame)
+    '''
+    def refineFingerPoints(frame, pnt, line, threshold, segmentation_color, segmentation, buffers, radius, scale_height):
+        frame_height, frame_width = frame.shape[:2]
+        blur_size = Finger_Detection.scaledSize(BLUR_VALUE, scale_height, odd=True)
+        dilation_size = Finger_Detection.scaledSize(DILATION_SIZE, scale_height, odd=True, minimum=3)
+        refined = pnt.astype(np.float64)
+
+        for i, (x, y) in enumerate(pnt):
+            x0, y0 = max(x - radius, 0), max(y - radius, 0)
+            x1, y1 = min(x + radius + 1, frame_width), min(y + radius + 1, frame_height)
+            if x1 - x0 <= blur_size or y1 - y0 <= blur_size:
+                continue
+
+            # Same cleaning of the hand mask as in findHand, but only in the neighborhood
+            mask = Finger_Detection.removeBG(frame[y0:y1, x0:x1], segmentation_color, segmentation, buffers, masked_frame=False, dilation_size=dilation_size)[1]
+            blurred = cv2.GaussianBlur(mask, (blur_size, blur_size), 0)
+            ys, xs = np.nonzero(blurred > threshold)
+            if len(xs) == 0:
+                continue
+
+            # Only consider the pixels within the radius (corners of the window may contain other fingers)
+            xs, ys = xs + x0 - x, ys + y0 - y
+            inside = xs ** 2 + ys ** 2 <= radius ** 2
+            xs, ys = xs[inside], ys[inside]
+            if len(xs) == 0:
+                continue
+
+            # The tip is the center of the outermost pixels (line points into the finger)
+            projection = -(xs * line[i, 0] + ys * line[i, 1])
+            outermost = projection >= projection.max() - 1
+            refined[i] = (x + xs[outermost].mean(), y + ys[outermost].mean())
+
+        return refined
 
-            fingers = Finger_Detection.detectFingers(res, finger_correction_scale)
+    '''
+    Returns the positions of finger tips in a given frame (same as findFingers)
+    The hand is segmented in a copy of the frame downscaled to working_height, only the fingertips are refined at full resolution
+    All pixel constants are scaled to the resolution they are applied at
+    If frame is a crop of the camera frame, camera_height is the height of the camera frame (the crop is downscaled by the same factor)
+    '''
+    def findFingersPyramid(frame, threshold, segmentation_color, finger_correction_scale, segmentation=None, buffers=None, working_height=PYRAMID_HEIGHT, camera_height=None, min_area=None):
+        if buffers is None:
+            buffers = Frame_Buffers()
+        frame_height, frame_width = frame.shape[:2]
+        camera_height = frame_height if camera_height is None else camera_height
+        factor = camera_height / working_height
+        small_size = (max(int(round(frame_width / factor)), 1), max(int(round(frame_height / factor)), 1))
+        if factor <= 1 or min(small_size) <= BLUR_VALUE:
+            return Finger_Detection.findFingers(frame, threshold, segmentation_color, finger_correction_scale, segmentation, buffers, min_area)
+
+        start = profiler.begin()
+        small = cv2.resize(frame, small_size, dst=buffers.get('downscaled', (small_size[1], small_size[0], 3)), interpolation=cv2.INTER_LINEAR)
+        profiler.record('downscale', start)
+
+        # Blurring (before the threshold) and dilation grow the hand mask and the neighborhood merges hull points, rounding
+        # their sizes up closes the gaps between the fingers and merges neighboring tips at low resolution, so they are rounded down
+        blur_size = Finger_Detection.scaledSize(BLUR_VALUE, working_height, odd=True, down=True)
+        dilation_size = Finger_Detection.scaledSize(DILATION_SIZE, working_height, odd=True, down=True)
+        neighborhood_size = Finger_Detection.scaledSize(NEIGHBORHOOD_SIZE, working_height, down=True)
+        small_min_area = None if min_area is None else min_area / factor ** 2
+        res, hull = Finger_Detection.findHand(small, threshold, segmentation_color, segmentation, buffers, blur_size, dilation_size, small_min_area)
+        if len(res) == 0:
+            return ([], res)
+
+        pnt, line = np.empty((0, 2), dtype=res.dtype), np.empty((0, 2))
+        if hull is not None:
+            pnt, line = Finger_Detection.detectFingerPoints(res, neighborhood_size, hull)
+
+        # Scale the contour back to frame coordinates
+        res = np.round(res * (frame_width / small_size[0], frame_height / small_size[1])).astype(res.dtype)
+
+        fingers = []
+        if len(pnt) > 0:
+            start = profiler.begin()
+            pnt = np.round(pnt * (frame_width / small_size[0], frame_height / small_size[1])).astype(np.int64)
+            radius = int(math.ceil(REFINE_RADIUS * factor))
+            refined = Finger_Detection.refineFingerPoints(frame, pnt, line, threshold, segmentation_color, segmentation, buffers, radius, camera_height)
+            fingers = np.round(refined + np.trunc(line * finger_correction_scale)).astype(np.int64).tolist()
+            profiler.record('refine', start)
 
         return (fingers, res)
+
+
+class Finger_Tracker():
+
+    '''
+    Searches the hand only in a region around the hand of the previous frame
+    Falls back to the full frame if the hand got lost or reached the border of the region
+    With pyramid set the hand is searched at lower resolution (see Finger_Detection.findFingersPyramid)
+    With a cache (see detection_cache) the detections of recorded frames are looked up by their timestamp and only missing ones are detected
+    The images of all detection steps are written into buffers (Frame_Buffers, e.g. owned by the plugin)
+    '''
+    def __init__(self, segmentation=None, pyramid=False, cache=None, buffers=None):
+        self.roi = None
+        self.segmentation = segmentation if segmentation is not None else Color_Segmentation()
+        self.buffers = buffers if buffers is not None else Frame_Buffers()
+        self.pyramid = pyramid
+        self.cache = cache
+
+    def reset(self):
+        self.roi = None
+
+    '''
+    Returns the positions of finger tips in a given frame (same as Finger_Detection.findFingers)
+    motion is the expected movement (pixels) of the hand since the previous frame, the search region is moved along
+    timestamp is the frame's key in the cache
+    '''
+    def findFingers(self, frame, threshold, segmentation_color, finger_correction_scale, motion=None, timestamp=None):
+        start = profiler.begin()
+        result = self.cache.get(timestamp) if self.cache is not None and timestamp is not None else None
+        if result is not None:
+            # The search region continues from the cached hand
+            if len(result[1]) > 0:
+                self.update_roi(result[1], frame.shape[1], frame.shape[0])
+            else:
+                self.roi = None
+        else:
+            if motion is not None and self.roi is not None:
+                self.shift_roi(motion, frame.shape[1], frame.shape[0])
+            result = self.track(frame, threshold, segmentation_color, finger_correction_scale)
+            if self.cache is not None and timestamp is not None:
+                self.cache.put(timestamp, *result)
+
+        # Hands with fingertips are accepted for adapting the color model
+        if len(result[0]) > 0:
+            self.segmentation.update(frame, result[1])
+        profiler.record('total', start)
+        profiler.endFrame()
+        return result
+
+    def track(self, frame, threshold, segmentation_color, finger_correction_scale):
+        frame_height, frame_width = frame.shape[:2]
+
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            fingers, contour = self.detect(frame[y0:y1, x0:x1], (frame_width, frame_height), threshold, segmentation_color, finger_correction_scale)
+
+            if len(contour) > 0:
+                # Move results back to frame coordinates
+                contour[:, 0] += (x0, y0)
+                fingers = [[tip[0] + x0, tip[1] + y0] for tip in fingers]
+
+                x, y, w, h = cv2.boundingRect(contour)
+                touches_left = x <= x0 and x0 > 0
+                touches_top = y <= y0 and y0 > 0
+                touches_right = x + w >= x1 and x1 < frame_width
+                touches_bottom = y + h >= y1 and y1 < frame_height
+
+                if not (touches_left or touches_top or touches_right or touches_bottom):
+                    self.update_roi(contour, frame_width, frame_height)
+                    return (fingers, contour)
+
+        # Hand lost or partially outside of the region, search the full frame
+        fingers, contour = self.detect(frame, (frame_width, frame_height), threshold, segmentation_color, finger_correction_scale)
+
+        if len(contour) > 0:
+            self.update_roi(contour, frame_width, frame_height)
+        else:
+            self.roi = None
+
+        return (fingers, contour)
+
+    def detect(self, frame, camera_size, threshold, segmentation_color, finger_correction_scale):
+        # Crops are checked against the minimal hand area of the camera frame
+        min_area = MIN_HAND_AREA * camera_size[0] * camera_size[1]
+        if self.pyramid:
+            return Finger_Detection.findFingersPyramid(frame, threshold, segmentation_color, finger_correction_scale, self.segmentation, self.buffers, camera_height=camera_size[1], min_area=min_area)
+        return Finger_Detection.findFingers(frame, threshold, segmentation_color, finger_correction_scale, self.segmentation, self.buffers, min_area)
+
+    def update_roi(self, contour, frame_width, frame_height):
+        x, y, w, h = cv2.boundingRect(contour)
+        self.roi = (max(x - TRACKING_MARGIN, 0), max(y - TRACKING_MARGIN, 0), min(x + w + TRACKING_MARGIN, frame_width), min(y + h + TRACKING_MARGIN, frame_height))
+
+    def shift_roi(self, motion, frame_width, frame_height):
+        dx, dy = int(round(motion[0])), int(round(motion[1]))
+        x0, y0, x1, y1 = self.roi
+        self.roi = (min(max(x0 + dx, 0), frame_width - 1), min(max(y0 + dy, 0), frame_height - 1), max(min(x1 + dx, frame_width), 1), max(min(y1 + dy, frame_height), 1))
@@ -0,0 +1,207 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import numpy as np
+
+MEASUREMENT_NOISE = 4. # Standard deviation of the detected tip positions (pixels)
+ACCELERATION_NOISE = 3000. # Standard deviation of the finger acceleration (pixels/s^2)
+INITIAL_VELOCITY_NOISE = 500. # Standard deviation of the velocity of a new track (pixels/s)
+GATE = 9.21 # Squared Mahalanobis distance up to which a tip can belong to a track (99% of a 2d normal distribution)
+MIN_HITS = 3 # Detections until a track is confirmed
+MAX_MISSES = 5 # Frames without matching tip until a track is dropped
+DEFAULT_DT = 1 / 30. # Time step (seconds) if the frames have no usable timestamps
+
+MEASUREMENT = np.array([[1., 0., 0., 0.], [0., 1., 0., 0.]])
+MEASUREMENT_COVARIANCE = np.eye(2) * MEASUREMENT_NOISE ** 2
+
+'''
+Solves the assignment problem (Hungarian method) for a rectangular cost matrix
+Returns the row and column indices of the assignment with the minimal total cost, sorted by row
+'''
+def assign(cost):
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+
+    # Potentials of rows (u) and columns (v), p[j] is the row (1-based) assigned to column j, column 0 is a virtual start
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.intp)
+    way = np.zeros(m + 1, dtype=np.intp)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+
+        # Grow alternating paths until a free column is reached
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+
+            j1 = np.argmin(np.where(free, minv[1:], np.inf)) + 1
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+
+        # Augment along the path
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    if transposed:
+        rows, cols = cols, rows
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+class Fingertip_Track():
+
+    '''
+    Constant velocity Kalman filter of a single fingertip, the state is (x, y, vx, vy) in pixels and pixels/s
+    '''
+    def __init__(self, track_id, tip):
+        self.id = track_id
+        self.state = np.array([tip[0], tip[1], 0., 0.])
+        self.covariance = np.diag([MEASUREMENT_NOISE ** 2] * 2 + [INITIAL_VELOCITY_NOISE ** 2] * 2)
+        self.hits = 1
+        self.misses = 0
+        self.matched = True
+
+    @property
+    def position(self):
+        return self.state[:2]
+
+    @property
+    def velocity(self):
+        return self.state[2:]
+
+    @property
+    def confirmed(self):
+        return self.hits >= MIN_HITS
+
+    def predict(self, dt):
+        transition = np.eye(4)
+        transition[0, 2] = transition[1, 3] = dt
+        noise = np.array([[dt ** 4 / 4, dt ** 3 / 2], [dt ** 3 / 2, dt ** 2]]) * ACCELERATION_NOISE ** 2
+        process_covariance = np.kron(noise, np.eye(2))
+
+        self.state = transition @ self.state
+        self.covariance = transition @ self.covariance @ transition.T + process_covariance
+        self.matched = False
+
+    '''
+    Returns the squared Mahalanobis distances of the tips (N,2) to the predicted position
+    '''
+    def distances(self, tips):
+        innovation = tips - self.position
+        innovation_covariance = MEASUREMENT @ self.covariance @ MEASUREMENT.T + MEASUREMENT_COVARIANCE
+        return np.einsum('ij,jk,ik->i', innovation, np.linalg.inv(innovation_covariance), innovation)
+
+    def correct(self, tip):
+        innovation_covariance = MEASUREMENT @ self.covariance @ MEASUREMENT.T + MEASUREMENT_COVARIANCE
+        gain = self.covariance @ MEASUREMENT.T @ np.linalg.inv(innovation_covariance)
+        self.state = self.state + gain @ (tip - self.position)
+        self.covariance = (np.eye(4) - gain @ MEASUREMENT) @ self.covariance
+        self.hits += 1
+        self.misses = 0
+        self.matched = True
+
+class Fingertip_Tracker():
+
+    '''
+    Tracks all detected fingertips over time and keeps a persistent track of the fingertip used for the calibration
+    Tips are associated to the tracks with the Hungarian method on the Mahalanobis distances, tips outside of the gate start new tracks
+    The calibration fingertip is the only confirmed track (when there is no calibration fingertip yet), it is kept as long as its track lives
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.tracks = []
+        self.next_id = 0
+        self.primary_id = None
+        self.timestamp = None
+
+    @property
+    def primary(self):
+        for track in self.tracks:
+            if track.id == self.primary_id:
+                return track
+        return None
+
+    def time_step(self, timestamp):
+        if self.timestamp is None or timestamp <= self.timestamp:
+            return DEFAULT_DT
+        return timestamp - self.timestamp
+
+    '''
+    Returns the predicted position (pixels) of the calibration fingertip at the given time, or None if there is no such fingertip
+    '''
+    def predict(self, timestamp):
+        track = self.primary
+        if track is None:
+            return None
+        return track.position + track.velocity * self.time_step(timestamp)
+
+    '''
+    Updates the tracks with the fingertips detected in the frame with the given timestamp
+    Returns the track of the calibration fingertip if its tip was detected in this frame, otherwise None
+    '''
+    def update(self, fingers, timestamp):
+        dt = self.time_step(timestamp)
+        self.timestamp = timestamp
+        tips = np.array(fingers, dtype=np.float64).reshape(-1, 2)
+
+        for track in self.tracks:
+            track.predict(dt)
+
+        matched_tips = np.zeros(len(tips), dtype=bool)
+        if self.tracks and len(tips) > 0:
+            cost = np.array([track.distances(tips) for track in self.tracks])
+            rows, cols = assign(np.minimum(cost, GATE * 10))
+            gated = cost[rows, cols] <= GATE
+            for row, col in zip(rows[gated], cols[gated]):
+                self.tracks[row].correct(tips[col])
+            matched_tips[cols[gated]] = True
+
+        for track in self.tracks:
+            if not track.matched:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= MAX_MISSES]
+
+        for tip in tips[~matched_tips]:
+            self.tracks.append(Fingertip_Track(self.next_id, tip))
+            self.next_id += 1
+
+        track = self.primary
+        if track is None:
+            self.primary_id = None
+            candidates = [track for track in self.tracks if track.confirmed and track.matched]
+            if len(candidates) == 1:
+                track = candidates[0]
+                self.primary_id = track.id
+
+        if track is not None and track.confirmed and track.matched:
+            return track
+        return None
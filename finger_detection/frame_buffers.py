@@ -0,0 +1,40 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import numpy as np
+
+class Frame_Buffers():
+
+    '''
+    Named image buffers which are reused across frames
+    Every buffer only grows, smaller images (e.g. crops) get a contiguous view into it
+    The buffers belong to one camera resolution, they are dropped when the resolution changes (see set_resolution)
+    '''
+    def __init__(self):
+        self.buffers = {}
+        self.resolution = None
+
+    def get(self, name, shape, dtype=np.uint8):
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = np.empty(size, dtype=dtype)
+            self.buffers[name] = buffer
+
+        return buffer[:size].reshape(shape)
+
+    '''
+    Drops all buffers if the frames have a new resolution (width, height), get() builds them again at the new size
+    '''
+    def set_resolution(self, resolution):
+        resolution = tuple(resolution)
+        if resolution != self.resolution:
+            self.clear()
+            self.resolution = resolution
+
+    def clear(self):
+        self.buffers = {}
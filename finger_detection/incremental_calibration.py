@@ -0,0 +1,141 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import numpy as np
+
+MAX_DISPERSION = 1 / 15. # Maximal time difference (seconds) of matched pupil and reference data (same as Pupil's closest_matches_monocular)
+POLYNOMIAL_TERMS = 7 # Terms of the polynomial which maps pupil to reference positions (Pupil's monocular 2d model)
+MIN_PREDICTION_SITES = 3 # Sample sites in the fit before the next site is predicted (fits with fewer sites than terms use the leading terms)
+
+'''
+Returns for every reference timestamp the index of the closest pupil timestamp (pupil_ts must be sorted)
+and whether the two timestamps are less than max_dispersion apart
+Ties go to the later pupil timestamp (as in Pupil's closest_matches_monocular)
+'''
+def match_nearest(pupil_ts, ref_ts, max_dispersion=MAX_DISPERSION):
+    if len(pupil_ts) == 0:
+        return np.zeros(len(ref_ts), dtype=np.intp), np.zeros(len(ref_ts), dtype=bool)
+
+    right = np.searchsorted(pupil_ts, ref_ts, side='left')
+    left = np.maximum(right - 1, 0)
+    right = np.minimum(right, len(pupil_ts) - 1)
+    closest = np.where(np.abs(ref_ts - pupil_ts[left]) < np.abs(ref_ts - pupil_ts[right]), left, right)
+    return closest, np.abs(pupil_ts[closest] - ref_ts) < max_dispersion
+
+def polynomial_features(norm_pos):
+    x, y = norm_pos[:, 0], norm_pos[:, 1]
+    return np.stack([np.ones_like(x), x, y, x * y, x ** 2, y ** 2, x ** 2 * y ** 2], axis=1)
+
+class Incremental_Calibration():
+
+    '''
+    Matches pupil data to the reference positions of every finished sampling run while the calibration is running
+    and keeps a least squares estimate (normal equations, updated with the new samples only) of the mapping per eye
+    Every new sample site is predicted by the estimate of the previous sites before it is added, the error of these predictions
+    shows a bad calibration early (the fitted residual stays near zero until there are more sites than polynomial terms)
+    The final calibration is still computed by Pupil
+    '''
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.gram = np.zeros((2, POLYNOMIAL_TERMS, POLYNOMIAL_TERMS))
+        self.moments = np.zeros((2, POLYNOMIAL_TERMS, 2))
+        self.samples = np.zeros(2, dtype=np.int64)
+        self.sites = np.zeros(2, dtype=np.int64) # Sample sites in the estimate
+        self.last_site = np.full(2, -1, dtype=np.int64)
+        self.prediction_errors = np.zeros((2, 2)) # Sum of squared prediction errors of new sites per axis
+        self.predicted = np.zeros(2, dtype=np.int64)
+        self.matched = []
+        self.pupil_offset = 0
+        self.ref_offset = 0
+
+    '''
+    Matches the references recorded since the last update to the closest pupil data of each eye and adds them to the estimates
+    pupil_records and ref_records are all recorded samples sorted by timestamp (see sample_recorder), only the new part is read
+    References are only matched once every eye has newer pupil data (the closest pupil datum might still be missing otherwise),
+    with final set all remaining references are matched
+    '''
+    def update(self, pupil_records, ref_records, final=False):
+        refs = np.array(ref_records[self.ref_offset:])
+        window = np.array(pupil_records[self.pupil_offset:])
+        timestamps = window['timestamp']
+
+        if not final:
+            eyes = np.unique(window['id'])
+            newest = min(timestamps[window['id'] == eye].max() for eye in eyes) if len(eyes) > 0 else -np.inf
+            refs = refs[:np.searchsorted(refs['timestamp'], newest, side='right')]
+        self.ref_offset += len(refs)
+        if len(refs) == 0:
+            return
+
+        for eye in (0, 1):
+            eye_indices = np.flatnonzero(window['id'] == eye)
+            if len(eye_indices) == 0:
+                continue
+            closest, valid = match_nearest(timestamps[eye_indices], refs['timestamp'])
+            pupil = window[eye_indices[closest[valid]]]
+            self.matched.append(pupil)
+            self.add_samples(eye, pupil['norm_pos'], refs['norm_pos'][valid], refs['site'][valid])
+
+        # Pupil data which is older than the last reference (minus the dispersion) can't belong to later references
+        self.pupil_offset += int(np.searchsorted(timestamps, refs['timestamp'][-1] - MAX_DISPERSION))
+
+    '''
+    Returns the least squares coefficients of the estimate with the given number of leading polynomial terms
+    '''
+    def coefficients(self, eye, terms=POLYNOMIAL_TERMS):
+        return np.linalg.lstsq(self.gram[eye, :terms, :terms], self.moments[eye, :terms], rcond=None)[0]
+
+    '''
+    Rank-k update of the normal equations with k matched samples (sites are their sample site indices, in increasing order)
+    Samples of sites which aren't in the estimate yet are predicted first, with as many terms as there are sites in the estimate
+    '''
+    def add_samples(self, eye, pupil_pos, ref_pos, sites):
+        if len(pupil_pos) == 0:
+            return
+        features = polynomial_features(pupil_pos)
+
+        new = sites > self.last_site[eye]
+        if new.any() and self.sites[eye] >= MIN_PREDICTION_SITES:
+            terms = min(self.sites[eye], POLYNOMIAL_TERMS)
+            errors = features[new, :terms] @ self.coefficients(eye, terms) - ref_pos[new]
+            self.prediction_errors[eye] += (errors ** 2).sum(axis=0)
+            self.predicted[eye] += new.sum()
+
+        self.gram[eye] += features.T @ features
+        self.moments[eye] += features.T @ ref_pos
+        self.samples[eye] += len(pupil_pos)
+        self.sites[eye] += len(np.unique(sites[new]))
+        self.last_site[eye] = max(self.last_site[eye], sites.max())
+
+    '''
+    Returns the RMS prediction error (in pixels of a frame with the given size) of the sites which were predicted before they were added, or None
+    '''
+    def prediction_error(self, eye, frame_size):
+        if self.predicted[eye] == 0:
+            return None
+        squared_errors = self.prediction_errors[eye] * np.square(frame_size)
+        return float(np.sqrt(squared_errors.sum() / self.predicted[eye]))
+
+    def summary(self, frame_size):
+        if frame_size is None:
+            return '-'
+        errors = [self.prediction_error(eye, frame_size) for eye in (0, 1)]
+        return ' / '.join('eye {}: {}'.format(eye, '-' if error is None else '{:.1f} px ({} samples)'.format(error, self.predicted[eye]))
+                          for eye, error in enumerate(errors))
+
+    '''
+    Returns the pupil records which are needed to match all references (sorted by timestamp, without duplicates):
+    the matched pupil data and the data which is recent enough to belong to references which haven't been matched yet
+    '''
+    def pupil_samples(self, pupil_records):
+        records = np.concatenate(self.matched + [np.array(pupil_records[self.pupil_offset:])])
+        order = np.lexsort((records['id'], records['timestamp']))
+        records = records[order]
+        unique = np.ones(len(records), dtype=bool)
+        unique[1:] = (records['timestamp'][1:] != records['timestamp'][:-1]) | (records['id'][1:] != records['id'][:-1])
+        return records[unique]
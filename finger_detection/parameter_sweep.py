@@ -0,0 +1,232 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Searches detection parameters (hand color and tolerances, mask threshold, finger correction scale) on labelled frames (runs without Pupil)
+# Usage: python -m finger_detection.parameter_sweep world.mp4 world_labels.npz --tolerance-h 10 20 30 --threshold 20 30 40 [--random 50]
+
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import os
+import sys
+import time
+import cv2
+import numpy as np
+from multiprocessing import shared_memory
+
+from . finger_detection import Finger_Detection
+from . color_segmentation import Color_Segmentation
+from . frame_buffers import Frame_Buffers
+from . batch_detection import read_frames, DEFAULT_COLOR, DEFAULT_THRESHOLD, DEFAULT_CORRECTION_SCALE
+
+# Parameters in the units of the plugin menu (hue in degrees, saturation and value in percent, correction scale in pixels)
+PARAMETERS = ['threshold', 'h', 's', 'v', 'tolerance_h', 'tolerance_s', 'tolerance_v', 'correction_scale']
+DEFAULTS = dict(zip(PARAMETERS, [DEFAULT_THRESHOLD] + DEFAULT_COLOR + [DEFAULT_CORRECTION_SCALE]))
+MAX_TIP_DISTANCE = 30 # Pixels, detected tips which are further away from every labelled tip count as false tips
+
+# Per process state of the workers, the frames are a view into the shared memory block
+worker_memory = None
+worker_frames = None
+worker_segmentation = None
+worker_buffers = None
+
+def init_worker(memory_name, shape):
+    global worker_memory, worker_frames, worker_segmentation, worker_buffers
+    # One thread per process, the workers already use all cores and the timings stay comparable
+    cv2.setNumThreads(1)
+    worker_memory = shared_memory.SharedMemory(name=memory_name)
+    worker_frames = np.ndarray(shape, dtype=np.uint8, buffer=worker_memory.buf)
+    worker_segmentation = Color_Segmentation()
+    worker_buffers = Frame_Buffers()
+
+'''
+Returns the fingertips of all frames and the time (seconds) spent in the detection with the given parameter set
+'''
+def evaluate(parameters, pyramid):
+    color_threshold = Color_Segmentation.normalizeThreshold(parameters['h'], parameters['s'], parameters['v'],
+                                                            parameters['tolerance_h'], parameters['tolerance_s'], parameters['tolerance_v'])
+    find = Finger_Detection.findFingersPyramid if pyramid else Finger_Detection.findFingers
+    tips = []
+    start = time.perf_counter()
+    for frame in worker_frames:
+        fingers, _ = find(frame, parameters['threshold'], color_threshold, parameters['correction_scale'], worker_segmentation, worker_buffers)
+        tips.append(fingers)
+    return tips, time.perf_counter() - start
+
+'''
+Matches detected tips to the labelled ones (greedy by distance, at most max_dist pixels apart)
+Returns the distances of all matches, the number of missed and the number of false tips (also used by benchmarks/detection_benchmark.py)
+'''
+def match_tips(detected, labelled, max_dist=MAX_TIP_DISTANCE):
+    detected = np.array(detected, dtype=np.float64).reshape(-1, 2)
+    labelled = np.array(labelled, dtype=np.float64).reshape(-1, 2)
+    if len(detected) == 0 or len(labelled) == 0:
+        return np.empty(0), len(labelled), len(detected)
+
+    dist = np.sqrt(((detected[:, None, :] - labelled[None, :, :]) ** 2).sum(axis=2))
+    matches = []
+    while dist.size > 0 and dist.min() <= max_dist:
+        i, j = np.unravel_index(dist.argmin(), dist.shape)
+        matches.append(dist[i, j])
+        dist[i, :] = np.inf
+        dist[:, j] = np.inf
+
+    return np.array(matches), len(labelled) - len(matches), len(detected) - len(matches)
+
+'''
+Returns the mean tip error (pixels, inf without matches), the recall and the false tips per frame of the detections
+'''
+def score(tips, labels):
+    distances = []
+    missed = false_tips = 0
+    for detected, labelled in zip(tips, labels):
+        frame_distances, frame_missed, frame_false = match_tips(detected, labelled)
+        distances.append(frame_distances)
+        missed += frame_missed
+        false_tips += frame_false
+
+    distances = np.concatenate(distances) if distances else np.empty(0)
+    labelled = len(distances) + missed
+    error = float(distances.mean()) if len(distances) > 0 else np.inf
+    recall = len(distances) / labelled if labelled > 0 else 1.
+    return error, recall, false_tips / max(len(labels), 1)
+
+'''
+Returns all combinations of the given values (dict of parameter to list of values)
+'''
+def grid_search(values):
+    return [dict(zip(values.keys(), combination)) for combination in itertools.product(*values.values())]
+
+'''
+Returns count parameter sets, every parameter is drawn uniformly between the smallest and the largest of its values (rounded like the menu sliders)
+'''
+def random_search(values, count, rng):
+    return [{name: int(round(rng.uniform(min(options), max(options)))) for name, options in values.items()} for _ in range(count)]
+
+'''
+Marks the results which no other result beats in both tip error and speed
+'''
+def pareto_front(results):
+    for result in results:
+        result['pareto'] = not any(other['error'] <= result['error'] and other['fps'] >= result['fps'] and
+                                   (other['error'] < result['error'] or other['fps'] > result['fps']) for other in results)
+
+'''
+Sorts the results: parameter sets which meet the accuracy target first (fastest first), then the others (most accurate first)
+'''
+def rank(results, max_error, min_recall):
+    pareto_front(results)
+    for result in results:
+        result['meets_target'] = result['error'] <= max_error and result['recall'] >= min_recall
+    return sorted(results, key=lambda result: (not result['meets_target'], -result['fps'] if result['meets_target'] else result['error']))
+
+'''
+Decodes the first count frames into a shared memory block, all frames must have the same size
+Returns the shared memory and the (count, height, width, 3) array in it
+'''
+def load_frames(path, count):
+    if count == 0:
+        raise ValueError('The labels contain no frames of {}'.format(path))
+    memory = None
+    index = 0
+    try:
+        for _, frame in read_frames(path):
+            if memory is None:
+                shape = (count,) + frame.shape
+                memory = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+                frames = np.ndarray(shape, dtype=np.uint8, buffer=memory.buf)
+            if frame.shape != frames.shape[1:]:
+                raise ValueError('Frame {} has size {}, expected {}'.format(index, frame.shape, frames.shape[1:]))
+            frames[index] = frame
+            index += 1
+            if index == count:
+                break
+
+        if index < count:
+            raise ValueError('{} has {} frames, the labels have {}'.format(path, index, count))
+    except BaseException:
+        # The shared memory outlives the process, it is released on every error (the array in it has to be dropped first)
+        if memory is not None:
+            frames = None
+            memory.close()
+            memory.unlink()
+        raise
+    return memory, frames
+
+'''
+Reads labelled fingertips in the layout of batch_detection (tips of frame i are tips[tip_offsets[i]:tip_offsets[i+1]])
+'''
+def load_labels(path):
+    data = np.load(path)
+    offsets = data['tip_offsets']
+    return [data['tips'][offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+'''
+Runs the detection with every parameter set over all frames with a process pool, the frames are shared with the workers
+Returns one result per parameter set: the parameters, mean tip error, recall, false tips per frame and frames per second
+'''
+def sweep(memory, frames, labels, parameter_sets, workers, pyramid=False):
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(memory.name, frames.shape)) as pool:
+        futures = [pool.submit(evaluate, parameters, pyramid) for parameters in parameter_sets]
+        for parameters, future in zip(parameter_sets, futures):
+            tips, duration = future.result()
+            error, recall, false_tips = score(tips, labels)
+            results.append(dict(parameters, error=error, recall=recall, false_tips=false_tips, fps=len(frames) / duration if duration > 0 else np.inf))
+    return results
+
+def save(output, results):
+    columns = PARAMETERS + ['error', 'recall', 'false_tips', 'fps', 'pareto', 'meets_target']
+    with open(output, 'w', newline='') as file:
+        writer = csv.DictWriter(file, columns)
+        writer.writeheader()
+        for result in results:
+            writer.writerow({column: result[column] for column in columns})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search fingertip detection parameters on labelled frames.')
+    parser.add_argument('input', help='video file or directory of images')
+    parser.add_argument('labels', help='labelled fingertips of the first frames (.npz with tip_offsets and tips, as written by batch_detection)')
+    parser.add_argument('-o', '--output', help='output .csv file with all parameter sets (default: <labels>_sweep.csv)')
+    for name in PARAMETERS:
+        parser.add_argument('--' + name.replace('_', '-'), type=float, nargs='+', default=[DEFAULTS[name]],
+            help='values to search (default: {}, as in the plugin)'.format(DEFAULTS[name]))
+    parser.add_argument('--random', type=int, metavar='COUNT', help='draw COUNT random parameter sets between the smallest and largest value of each parameter instead of the full grid')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random search')
+    parser.add_argument('--pyramid', action='store_true', help='search the hand at lower resolution and refine the fingertips at full resolution')
+    parser.add_argument('--max-error', type=float, default=10., help='accuracy target: mean tip error in pixels')
+    parser.add_argument('--min-recall', type=float, default=0.9, help='accuracy target: share of labelled tips which are detected')
+    parser.add_argument('--top', type=int, default=10, help='number of parameter sets to print')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of detection processes (default: number of cores)')
+    args = parser.parse_args(argv)
+
+    values = {name: getattr(args, name) for name in PARAMETERS}
+    parameter_sets = random_search(values, args.random, np.random.RandomState(args.seed)) if args.random else grid_search(values)
+    output = args.output or os.path.splitext(os.path.normpath(args.labels))[0] + '_sweep.csv'
+
+    labels = load_labels(args.labels)
+    memory, frames = load_frames(args.input, len(labels))
+    try:
+        start = time.perf_counter()
+        results = sweep(memory, frames, labels, parameter_sets, args.workers, args.pyramid)
+        duration = time.perf_counter() - start
+    finally:
+        del frames
+        memory.close()
+        memory.unlink()
+
+    results = rank(results, args.max_error, args.min_recall)
+    save(output, results)
+
+    print('Evaluated {} parameter sets on {} frames in {:.1f} seconds, results stored in {}'.format(len(results), len(labels), duration, output))
+    print(' '.join('{:>12}'.format(name) for name in PARAMETERS + ['error [px]', 'recall', 'false/frame', 'fps', 'target', 'pareto']))
+    for result in results[:args.top]:
+        print(' '.join('{:>12g}'.format(result[name]) for name in PARAMETERS) + ' {:>12.2f} {:>12.3f} {:>12.3f} {:>12.1f} {:>12} {:>12}'.format(
+            result['error'], result['recall'], result['false_tips'], result['fps'], 'yes' if result['meets_target'] else 'no', 'yes' if result['pareto'] else 'no'))
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,105 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import threading
+import time
+import numpy as np
+
+STAGES = ['downscale', 'removeBG', 'threshold', 'findContours', 'selectContour', 'getHullPoints', 'convexityDefects', 'fingertips', 'refine', 'total']
+COUNTS = ['contour_points', 'hull_points', 'hull_neighborhoods', 'defects']
+CAPACITY = 1000 # Number of frames kept in the ring buffer
+
+class Stage_Profiler():
+
+    '''
+    Records the wall time (ms) of every detection stage and the contour sizes of the last CAPACITY frames
+    Disabled by default, begin() then returns None and all other calls return immediately
+    Detections may run in several threads (background worker, batch workers): every thread measures its own frame
+    and the finished frames are added to the ring buffer under a lock
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.columns = {name: index for index, name in enumerate(STAGES + COUNTS)}
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.rows = np.full((CAPACITY, len(self.columns)), np.nan)
+            self.local = threading.local()
+            self.index = 0
+            self.frames = 0
+            self.percentiles = None
+            self.percentiles_frames = -1
+
+    '''
+    Returns the measurements of the frame the calling thread is detecting
+    '''
+    def getCurrent(self):
+        current = getattr(self.local, 'current', None)
+        if current is None:
+            current = self.local.current = np.zeros(len(self.columns))
+        return current
+
+    def begin(self):
+        return time.perf_counter() if self.enabled else None
+
+    '''
+    Adds the time since start to the stage and returns the current time (start of the next stage)
+    '''
+    def record(self, stage, start):
+        if start is None:
+            return None
+        now = time.perf_counter()
+        self.getCurrent()[self.columns[stage]] += (now - start) * 1000
+        return now
+
+    def count(self, name, value):
+        if self.enabled:
+            self.getCurrent()[self.columns[name]] = value
+
+    '''
+    Stores the measurements of the calling thread's current frame in the ring buffer
+    '''
+    def endFrame(self):
+        if not self.enabled:
+            return
+        current = self.getCurrent()
+        with self.lock:
+            self.rows[self.index] = current
+            self.index = (self.index + 1) % CAPACITY
+            self.frames += 1
+        current[:] = 0
+
+    '''
+    Returns the 50th, 95th and 99th percentile of every column over the buffered frames
+    '''
+    def getPercentiles(self):
+        with self.lock:
+            if self.percentiles_frames != self.frames:
+                filled = self.rows[:min(self.frames, CAPACITY)]
+                if len(filled) > 0:
+                    self.percentiles = np.percentile(filled, [50, 95, 99], axis=0)
+                else:
+                    self.percentiles = np.full((3, len(self.columns)), np.nan)
+                self.percentiles_frames = self.frames
+            return self.percentiles
+
+    def summary(self, name):
+        p50, p95, p99 = self.getPercentiles()[:, self.columns[name]]
+        return '{:.2f} / {:.2f} / {:.2f}'.format(p50, p95, p99)
+
+    '''
+    Writes the buffered frames (oldest first) to a CSV file
+    '''
+    def save(self, file_name):
+        with self.lock:
+            rows = np.roll(self.rows, -self.index, axis=0) if self.frames >= CAPACITY else self.rows[:self.frames].copy()
+        header = ','.join('{}_ms'.format(name) for name in STAGES) + ',' + ','.join(COUNTS)
+        np.savetxt(file_name, rows, delimiter=',', header=header, comments='', fmt='%.4f')
+
+# Shared by all detections, enabled e.g. from the Finger_Calibration menu
+profiler = Stage_Profiler()
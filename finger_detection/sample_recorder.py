@@ -0,0 +1,145 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+import bisect
+import os
+import tempfile
+import numpy as np
+
+CHUNK_SIZE = 1024 # Number of records kept in memory before they are appended to the file
+
+# Pupil data as needed by Pupil's 2d and 3d calibration (3d fields are NaN for 2d data), method is the detector's method string
+PUPIL_DTYPE = np.dtype([('timestamp', 'f8'), ('id', 'i1'), ('confidence', 'f8'), ('norm_pos', 'f8', 2), ('method', 'S32'),
+                        ('circle_3d_normal', 'f8', 3), ('sphere_center', 'f8', 3), ('sphere_radius', 'f8')])
+# Reference positions: normalized and in pixels (screen_pos), with the index of their sample site
+REFERENCE_DTYPE = np.dtype([('timestamp', 'f8'), ('norm_pos', 'f8', 2), ('screen_pos', 'f8', 2), ('site', 'i4')])
+# Gaze mapped by the active calibration (recorded during accuracy tests)
+GAZE_DTYPE = np.dtype([('timestamp', 'f8'), ('confidence', 'f8'), ('norm_pos', 'f8', 2)])
+# Fingertips (pixels) at the sample sites
+FINGER_DTYPE = np.dtype([('timestamp', 'f8'), ('tip', 'i4', 2)])
+
+class Sample_Recorder():
+
+    '''
+    Appends fixed size records of the given dtype to a binary file, only the newest chunk of records is kept in memory
+    Without a path the records are stored in a temporary file which is deleted by close()
+    Records are kept sorted by timestamp (pupil data of the two eyes doesn't arrive in order), so time windows are found by bisection
+    '''
+    def __init__(self, dtype, path=None, directory=None):
+        self.dtype = np.dtype(dtype)
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix='finger_samples_', suffix='.bin', dir=directory)
+            os.close(handle)
+            self.temporary = True
+        else:
+            self.temporary = False
+        self.path = path
+        self.file = open(path, 'wb')
+        self.chunk = np.zeros(CHUNK_SIZE, dtype=self.dtype)
+        self.chunk_size = 0
+        self.size = 0
+        self.last_written = -np.inf # Newest timestamp in the file
+
+    def __len__(self):
+        return self.size
+
+    '''
+    Appends a record, given as tuple in the field order of the dtype
+    A record which is older than the newest one in the chunk is moved to its place (late records are only a few positions off)
+    '''
+    def append(self, record):
+        chunk, size = self.chunk, self.chunk_size
+        chunk[size] = record
+        if size > 0 and chunk['timestamp'][size] < chunk['timestamp'][size - 1]:
+            index = int(np.searchsorted(chunk['timestamp'][:size], chunk['timestamp'][size], side='right'))
+            record = chunk[size].copy()
+            chunk[index + 1:size + 1] = chunk[index:size]
+            chunk[index] = record
+        self.chunk_size += 1
+        self.size += 1
+        if self.chunk_size == CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.chunk_size > 0:
+            chunk = self.chunk[:self.chunk_size]
+            if chunk['timestamp'][0] < self.last_written:
+                # Late records belong before the newest written ones, only the overlapping end of the file is merged with them
+                written = self.size - self.chunk_size
+                records = np.memmap(self.path, dtype=self.dtype, mode='r+', shape=(written,))
+                start = bisect.bisect_right(records['timestamp'], chunk['timestamp'][0])
+                merged = np.concatenate([records[start:], chunk])
+                merged = merged[np.argsort(merged['timestamp'], kind='stable')]
+                records[start:] = merged[:written - start]
+                del records
+                chunk = merged[written - start:]
+            self.file.write(chunk.tobytes())
+            self.last_written = chunk['timestamp'][-1]
+            self.chunk_size = 0
+        self.file.flush()
+
+    '''
+    Returns all records sorted by timestamp as read-only structured array (memory-mapped, the file isn't loaded into memory)
+    '''
+    def read(self):
+        self.flush()
+        if self.size == 0:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(self.path, dtype=self.dtype, mode='r', shape=(self.size,))
+
+    '''
+    Returns the records with start <= timestamp <= end (a view of read(), only O(log n) records are accessed to find it)
+    '''
+    def window(self, start, end):
+        records = self.read()
+        # bisect reads single timestamps of the memory map, np.searchsorted would copy the strided column first
+        timestamps = records['timestamp']
+        return records[bisect.bisect_left(timestamps, start):bisect.bisect_right(timestamps, end)]
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+        if self.temporary:
+            os.remove(self.path)
+
+def pupil_record(datum):
+    circle = datum.get('circle_3d')
+    sphere = datum.get('sphere')
+    if circle is not None and sphere is not None:
+        normal, center, radius = circle['normal'], sphere['center'], sphere['radius']
+    else:
+        normal, center, radius = (np.nan,) * 3, (np.nan,) * 3, np.nan
+    return (datum['timestamp'], datum['id'], datum['confidence'], datum['norm_pos'], datum.get('method', '').encode(), normal, center, radius)
+
+def reference_record(ref):
+    return (ref['timestamp'], ref['norm_pos'], ref['screen_pos'], ref['site'])
+
+def gaze_record(datum):
+    return (datum['timestamp'], datum['confidence'], datum['norm_pos'])
+
+'''
+Converts recorded pupil data back to Pupil's pupil datum dicts
+Only the recorded fields are restored (the calibration data saved by Pupil contains nothing else)
+'''
+def pupil_dicts(records):
+    data = []
+    columns = zip(records['timestamp'].tolist(), records['id'].tolist(), records['confidence'].tolist(), records['norm_pos'].tolist(),
+                  records['method'].astype('U32').tolist(), records['circle_3d_normal'].tolist(), records['sphere_center'].tolist(),
+                  records['sphere_radius'].tolist())
+    for timestamp, eye_id, confidence, norm_pos, method, normal, center, radius in columns:
+        datum = {'topic': 'pupil.{}'.format(eye_id), 'id': eye_id, 'timestamp': timestamp, 'confidence': confidence, 'norm_pos': tuple(norm_pos),
+                 'method': method}
+        if radius == radius: # NaN for 2d data
+            datum['circle_3d'] = {'normal': tuple(normal)}
+            datum['sphere'] = {'center': tuple(center), 'radius': radius}
+        data.append(datum)
+    return data
+
+def reference_dicts(records):
+    columns = zip(records['timestamp'].tolist(), records['norm_pos'].tolist(), records['screen_pos'].tolist())
+    return [{'timestamp': timestamp, 'norm_pos': tuple(norm_pos), 'screen_pos': screen_pos} for timestamp, norm_pos, screen_pos in columns]
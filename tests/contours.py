@@ -0,0 +1,58 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Fixed contours for the parity tests: random star polygons (noisy, many hull points and defects) and synthetic hands
+
+import cv2
+import numpy as np
+
+from synthetic_hands import HAND_COLOR, render_hand
+
+'''
+Returns the biggest external contour of the mask (as found by findFingers)
+'''
+def biggest_contour(mask):
+    contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+    return max(contours, key=cv2.contourArea)
+
+'''
+Returns the contour of a star polygon with random spikes and jagged edges, the same for the same seed
+'''
+def star_contour(seed, size=480):
+    rng = np.random.RandomState(seed)
+    count = rng.randint(5, 40)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, 2 * count))
+    radii = np.where(np.arange(2 * count) % 2 == 0, rng.uniform(0.25, 0.45, 2 * count), rng.uniform(0.05, 0.2, 2 * count)) * size
+    radii += rng.normal(0, 0.01 * size, 2 * count)
+    points = np.stack([size / 2 + radii * np.cos(angles), size / 2 + radii * np.sin(angles)], axis=1)
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.fillPoly(mask, [np.round(points).astype(np.int32)], 255)
+    return biggest_contour(mask)
+
+'''
+Returns the contour of a disc with many teeth of random depth (a noisy outline with many convexity defects), the same for the same seed
+'''
+def jagged_contour(seed, size=960):
+    rng = np.random.RandomState(seed)
+    count = rng.randint(40, 120)
+    angles = np.linspace(0, 2 * np.pi, 2 * count, endpoint=False) + rng.uniform(0, np.pi / (4 * count), 2 * count)
+    radii = np.where(np.arange(2 * count) % 2 == 0, 0.45, 0.45 - rng.uniform(0.01, 0.06, 2 * count)) * size
+    points = np.stack([size / 2 + radii * np.cos(angles), size / 2 + radii * np.sin(angles)], axis=1)
+    mask = np.zeros((size, size), dtype=np.uint8)
+    cv2.fillPoly(mask, [np.round(points).astype(np.int32)], 255)
+    return biggest_contour(mask)
+
+'''
+Returns the contour of a rendered hand with a random number of fingers, scale and rotation, the same for the same seed
+'''
+def hand_contour(seed):
+    rng = np.random.RandomState(seed)
+    frame, _ = render_hand(640, 480, fingers=rng.randint(1, 6), scale=rng.uniform(0.8, 1.6), rotation=rng.uniform(-40, 40), rng=rng)
+    return biggest_contour(cv2.inRange(frame, HAND_COLOR, HAND_COLOR))
+
+STAR_SEEDS = range(150)
+JAGGED_SEEDS = range(30)
+HAND_SEEDS = range(40)
@@ -0,0 +1,59 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# The lookup table segmentation against the exact HSV thresholding
+
+import numpy as np
+import pytest
+
+from finger_detection.color_segmentation import Color_Segmentation, MAX_LUT_BITS
+from finger_detection.frame_buffers import Frame_Buffers
+from synthetic_hands import render_hand
+
+THRESHOLDS = [Color_Segmentation.normalizeThreshold(20, 36, 62, 20, 24, 38), Color_Segmentation.normalizeThreshold(0, 60, 60, 20, 40, 40),
+              Color_Segmentation.normalizeThreshold(350, 50, 50, 30, 30, 30)]
+
+'''
+Returns a frame of all bin center colors of the given quantization
+'''
+def bin_centers(bits):
+    shift = 8 - bits
+    centers = (np.arange(1 << bits) << shift) + (1 << shift >> 1)
+    colors = np.stack(np.meshgrid(centers, centers, centers, indexing='ij'), axis=-1).astype(np.uint8)
+    return colors.reshape(1 << bits, -1, 3)
+
+@pytest.mark.parametrize('bits', range(1, MAX_LUT_BITS + 1))
+@pytest.mark.parametrize('threshold', THRESHOLDS)
+def test_bin_centers_are_exact(bits, threshold):
+    frame = bin_centers(bits)
+    assert np.array_equal(Color_Segmentation(lut_bits=bits).getMask(frame, threshold), Color_Segmentation().getMask(frame, threshold))
+
+@pytest.mark.parametrize('threshold', THRESHOLDS)
+def test_agreement_on_hands(threshold):
+    rng = np.random.RandomState(0)
+    frame = render_hand(1280, 720, 5, noise=8, clutter=10, rng=rng)[0]
+    reference = Color_Segmentation().getMask(frame, threshold)
+    mask = Color_Segmentation(lut_bits=6).getMask(frame, threshold, Frame_Buffers())
+    assert np.count_nonzero(mask == reference) / mask.size >= 0.99
+
+def test_stacks_taller_than_remap_limit():
+    frame = render_hand(640, 480, 3, rng=np.random.RandomState(1))[0]
+    stack = np.concatenate([frame] * 70)
+    segmentation = Color_Segmentation(lut_bits=6)
+    single = segmentation.getMask(frame, THRESHOLDS[0]).copy()
+    masks = segmentation.getMask(stack, THRESHOLDS[0]).reshape(70, 480, 640)
+    assert all(np.array_equal(mask, single) for mask in masks)
+
+def test_table_follows_threshold():
+    frame = render_hand(640, 480, 3, rng=np.random.RandomState(2))[0]
+    segmentation = Color_Segmentation(lut_bits=7)
+    for threshold in THRESHOLDS + THRESHOLDS[:1]:
+        reference = Color_Segmentation().getMask(frame, threshold)
+        assert np.count_nonzero(segmentation.getMask(frame, threshold) == reference) / reference.size >= 0.99
+
+def test_invalid_bits():
+    with pytest.raises(ValueError):
+        Color_Segmentation(lut_bits=8)
@@ -0,0 +1,125 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Parity of the vectorized defect evaluation in detectFingers with the original loop over the defects
+
+import math
+import cv2
+import numpy as np
+
+from finger_detection.finger_detection import Finger_Detection, NEIGHBORHOOD_SIZE, LOWER_CUT_PERCENTAGE
+from contours import star_contour, jagged_contour, hand_contour, STAR_SEEDS, JAGGED_SEEDS, HAND_SEEDS
+
+CONTOURS = {'star': star_contour, 'jagged': jagged_contour, 'hand': hand_contour}
+
+FINGER_CORRECTION_SCALE = 25
+
+'''
+The original getCorrectionVector, wrong_rotations counts how often the rotation of d1 went the wrong way
+'''
+wrong_rotations = [0]
+def reference_correction_vector(pnt, d1, d2, angle):
+    angle = angle * (math.pi / 180)
+
+    qx = pnt[0] + math.cos(angle/2) * (d1[0] - pnt[0]) - math.sin(angle/2) * (d1[1] - pnt[1])
+    qy = pnt[1] + math.sin(angle/2) * (d1[0] - pnt[0]) + math.cos(angle/2) * (d1[1] - pnt[1])
+    q = [qx, qy]
+
+    if Finger_Detection.ptDist(d2, q) > Finger_Detection.ptDist(d2, d1):
+        wrong_rotations[0] += 1
+        qx = pnt[0] + math.cos(angle/2) * (d2[0] - pnt[0]) - math.sin(angle/2) * (d2[1] - pnt[1])
+        qy = pnt[1] + math.sin(angle/2) * (d2[0] - pnt[0]) + math.cos(angle/2) * (d2[1] - pnt[1])
+        q = [qx, qy]
+
+    line = q - pnt
+    magnitude = np.sqrt(line.dot(line))
+    return line/magnitude
+
+'''
+The original loop of detectFingers over the defects of the given (reduced) hull
+'''
+def reference_fingers(res, hull, finger_correction_scale):
+    fingerTips = []
+    defects = cv2.convexityDefects(res, hull)
+    if defects is None:
+        return fingerTips
+    defects = defects.reshape(-1, 4)
+
+    defectNeighbors = {}
+    for i in range(defects.shape[0]):
+        s, e, f, _ = defects[i]
+        defectNeighbors.setdefault(s, []).append(f)
+        defectNeighbors.setdefault(e, []).append(f)
+
+    extTop = tuple(res[res[:, :, 1].argmin()][0])
+    extBottom = tuple(res[res[:, :, 1].argmax()][0])
+    height = extTop[1] - extBottom[1]
+    height_threshold = extBottom[1] + int(LOWER_CUT_PERCENTAGE * height)
+
+    for pntIndex, defecIndices in defectNeighbors.items():
+        if len(defecIndices) == 2:
+            pnt = res[pntIndex][0]
+            d1 = res[defecIndices[0]][0]
+            d2 = res[defecIndices[1]][0]
+
+            a = Finger_Detection.ptDist(d1, d2)
+            b = Finger_Detection.ptDist(pnt, d1)
+            c = Finger_Detection.ptDist(pnt, d2)
+
+            if pnt[1] > height_threshold:
+                continue
+
+            term = (b ** 2 + c ** 2 - a ** 2) / (2 * b * c)
+            angle = math.acos(min(1, max(-1, term))) * (180 / math.pi)
+
+            if angle <= 60:
+                line = reference_correction_vector(pnt, d1, d2, angle)
+                tip = pnt + [int(line[0]*finger_correction_scale), int(line[1]*finger_correction_scale)]
+                fingerTips.append([tip[0], tip[1]])
+    return fingerTips
+
+'''
+Returns whether OpenCV accepts the convex hull of the contour (it rejects the hull of a few contours with touching spikes)
+'''
+def valid_hull(res):
+    try:
+        cv2.convexityDefects(res, cv2.convexHull(res, returnPoints=False))
+    except cv2.error:
+        return False
+    return True
+
+# Small neighborhoods keep more hull points, which gives noisy contours with many defects
+CASES = ([('star', seed, size) for seed in STAR_SEEDS for size in (NEIGHBORHOOD_SIZE, 10)] + [('jagged', seed, size) for seed in JAGGED_SEEDS for size in (NEIGHBORHOOD_SIZE, 10)] +
+         [('hand', seed, NEIGHBORHOOD_SIZE) for seed in HAND_SEEDS])
+
+def test_same_fingertips():
+    wrong_rotations[0] = 0
+    defects = 0
+    for kind, seed, neighborhood_size in CASES:
+        res = CONTOURS[kind](seed)
+        if not valid_hull(res):
+            continue
+        hull = Finger_Detection.getHullPoints(res, neighborhood_size)
+        reference = reference_fingers(res, hull, FINGER_CORRECTION_SCALE)
+        assert Finger_Detection.detectFingers(res, FINGER_CORRECTION_SCALE, neighborhood_size) == [[int(x), int(y)] for x, y in reference], (kind, seed, neighborhood_size)
+        found = cv2.convexityDefects(res, hull)
+        defects = max(defects, 0 if found is None else len(found))
+
+    # The contours exercise both rotation directions and contours with many defects
+    assert wrong_rotations[0] > 0
+    assert defects >= 40
+
+def test_correction_vectors():
+    rng = np.random.RandomState(0)
+    pnt = rng.uniform(0, 500, (1000, 2))
+    d1 = pnt + rng.uniform(-100, 100, (1000, 2))
+    d2 = pnt + rng.uniform(-100, 100, (1000, 2))
+    angle = rng.uniform(1, 60, 1000)
+
+    wrong_rotations[0] = 0
+    reference = np.array([reference_correction_vector(*row) for row in zip(pnt, d1, d2, angle)])
+    assert 0 < wrong_rotations[0] < len(pnt)
+    np.testing.assert_allclose(Finger_Detection.getCorrectionVectors(pnt, d1, d2, angle), reference, rtol=0, atol=1e-12)
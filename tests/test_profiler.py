@@ -0,0 +1,64 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Profiling of detections which run in several threads at once
+
+import threading
+import numpy as np
+import pytest
+
+from finger_detection.finger_detection import Finger_Detection
+from finger_detection.color_segmentation import Color_Segmentation
+from finger_detection.profiler import profiler, STAGES, COUNTS
+from synthetic_hands import render_hand
+
+THRESHOLD = Color_Segmentation.normalizeThreshold(20, 36, 62, 20, 24, 38)
+
+@pytest.fixture
+def enabled_profiler():
+    profiler.reset()
+    profiler.enabled = True
+    yield profiler
+    profiler.enabled = False
+    profiler.reset()
+
+def frames(count):
+    rng = np.random.RandomState(0)
+    return np.stack([render_hand(640, 480, rng.randint(1, 6), rng=rng)[0] for _ in range(count)])
+
+def test_batch_rows_match_frames(enabled_profiler):
+    stack = frames(24)
+    _, hands = Finger_Detection.findFingersBatch(stack, 30, THRESHOLD, 25, workers=4)
+
+    assert enabled_profiler.frames == len(stack)
+    rows = enabled_profiler.rows[:len(stack)]
+    contour_points = rows[:, len(STAGES) + COUNTS.index('contour_points')]
+    # Rows are in completion order, every frame's contour size appears exactly once
+    assert sorted(contour_points) == sorted(hands['contour_points'])
+    total = rows[:, STAGES.index('total')]
+    assert (total > 0).all()
+    # The stages of a frame can't take longer than the frame itself
+    stages = rows[:, [STAGES.index(stage) for stage in ('removeBG', 'threshold', 'findContours', 'selectContour')]]
+    assert (stages.sum(axis=1) <= total).all()
+
+def test_threads_dont_mix_frames(enabled_profiler):
+    stack = frames(8)
+    def detect():
+        for frame in stack:
+            Finger_Detection.findFingers(frame, 30, THRESHOLD, 25)
+            enabled_profiler.record('total', enabled_profiler.begin())
+            enabled_profiler.endFrame()
+
+    threads = [threading.Thread(target=detect) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert enabled_profiler.frames == 4 * len(stack)
+    contour_points = enabled_profiler.rows[:enabled_profiler.frames, len(STAGES) + COUNTS.index('contour_points')]
+    expected = [len(Finger_Detection.findFingers(frame, 30, THRESHOLD, 25)[1]) for frame in stack]
+    assert sorted(contour_points) == sorted(expected * 4)
@@ -0,0 +1,44 @@
+'''
+(*)~---------------------------------------------------------------------------
+Copyright (C) 2017-2018  Sander Staal
+---------------------------------------------------------------------------~(*)
+'''
+
+# Fingertips of the pyramid mode against the detection at full resolution
+
+import numpy as np
+import pytest
+
+from finger_detection.finger_detection import Finger_Detection
+from finger_detection.color_segmentation import Color_Segmentation
+from finger_detection.parameter_sweep import match_tips
+from synthetic_hands import RESOLUTIONS, render_hand
+
+THRESHOLD = 30
+CORRECTION_SCALE = 25
+COLOR_THRESHOLD = Color_Segmentation.normalizeThreshold(20, 36, 62, 20, 24, 38)
+MAX_TIP_ERROR = 0.08 # relative to the frame height, as in the detection benchmark
+FRAMES = 8
+
+'''
+Returns the share of the rendered tips which were detected
+'''
+def recall(detect, rendered, height):
+    missed = total = 0
+    for frame, tips in rendered:
+        fingers = detect(frame, THRESHOLD, COLOR_THRESHOLD, CORRECTION_SCALE)[0]
+        missed += match_tips(fingers, tips, MAX_TIP_ERROR * height)[1]
+        total += len(tips)
+    return (total - missed) / total
+
+# The full resolution detection misses the hand of one of the 4K frames as well
+@pytest.mark.parametrize('resolution, fingers, scale, minimum', [('720p', 1, 0.6, 0.95), ('720p', 3, 0.6, 0.95), ('720p', 5, 0.5, 0.95),
+                                                                 ('1080p', 1, 0.5, 0.95), ('1080p', 5, 0.6, 0.95), ('4k', 5, 0.5, 0.85)])
+def test_no_tips_lost(resolution, fingers, scale, minimum):
+    width, height = RESOLUTIONS[resolution]
+    rng = np.random.RandomState(0)
+    rendered = [render_hand(width, height, fingers, scale, int(rng.randint(-30, 31)), 8, 5, rng) for _ in range(FRAMES)]
+
+    pyramid = recall(Finger_Detection.findFingersPyramid, rendered, height)
+    assert pyramid >= minimum
+    assert pyramid >= recall(Finger_Detection.findFingers, rendered, height)